@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+# Load .env BEFORE importing modules that read env at import time
+load_dotenv()
+
+from cache import make_result_cache, normalize_query
+from gemini import (
+    AGENTS, build_tool_session, gemini_limiter, model_router, quiet_logger, run_agents, server_params,
+)
+from mcp_pool import McpSessionPool
+from price_export import PriceParquetWriter
+from price_history import PRICE_MAX_AGE, PriceHistory
+from schemas import SECTION_SCHEMAS, PriceComparison, PriceOffer, to_jsonable
+from telemetry import Tracer
+
+# One row per retailer offer, so price data loads straight into a dataframe or spreadsheet
+OFFER_COLUMNS = ["query", *PriceOffer.model_fields, "finished_at"]
+
+
+def read_queries(path):
+    """Read product queries from a CSV (a "query" column, else the first column) or JSONL file."""
+    queries = []
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                queries.append(record["query"] if isinstance(record, dict) else str(record))
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        if rows and "query" in [cell.strip().lower() for cell in rows[0]]:
+            column = [cell.strip().lower() for cell in rows[0]].index("query")
+            rows = rows[1:]
+        else:
+            column = 0
+        queries = [row[column] for row in rows if len(row) > column]
+    return [query.strip() for query in queries if query.strip()]
+
+
+def read_completed(path):
+    """Normalized queries that already have a successful record in the output file."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            if "error" not in record:
+                completed.add(normalize_query(record.get("query", "")))
+    return completed
+
+
+def write_offer_rows(writer, query, price, finished_at):
+    if not isinstance(price, PriceComparison):
+        return
+    for offer in price.offers:
+        writer.writerow({"query": query, **offer.model_dump(), "finished_at": finished_at})
+
+
+async def run_batch(queries, out_path, concurrency=4, gemini_concurrency=6, mcp_concurrency=8,
+                    pool_size=2, verbose=False, trace_path=None, offers_path=None, parquet_dir=None,
+                    history_path=None, reuse_prices_sec=PRICE_MAX_AGE, shared_search=True, pre_scrape=0,
+                    price_fast_path=True):
+    completed = read_completed(out_path)
+    pending = []
+    for query in queries:
+        normalized = normalize_query(query)
+        if normalized not in completed:
+            completed.add(normalized)  # also drops duplicates within the input
+            pending.append(query)
+    print(f"📦 {len(queries)} queries, {len(queries) - len(pending)} already done, {len(pending)} to run")
+    if not pending:
+        return
+
+    pool = McpSessionPool(server_params, size=pool_size)
+    gemini_semaphore = asyncio.Semaphore(gemini_concurrency)
+    tracer = Tracer(path=trace_path) if trace_path else None
+    session = build_tool_session(pool.session(), tracer=tracer, semaphore=asyncio.Semaphore(mcp_concurrency))
+    cache = make_result_cache()
+    price_history = PriceHistory(history_path)
+    loggers = None if verbose else {key: quiet_logger for key, _, _ in AGENTS}
+
+    queue = asyncio.Queue()
+    for query in pending:
+        queue.put_nowait(query)
+    done_count = 0
+
+    offers_file = None
+    offers_writer = None
+    if offers_path:
+        new_file = not os.path.exists(offers_path) or os.path.getsize(offers_path) == 0
+        offers_file = open(offers_path, "a", newline="", encoding="utf-8")
+        offers_writer = csv.DictWriter(offers_file, fieldnames=OFFER_COLUMNS)
+        if new_file:
+            offers_writer.writeheader()
+    parquet_writer = PriceParquetWriter(parquet_dir) if parquet_dir else None
+
+    with open(out_path, "a", encoding="utf-8") as out:
+        async def worker():
+            nonlocal done_count
+            while not queue.empty():
+                query = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    results = await run_agents(
+                        session, query, AGENTS, loggers=loggers, cache=cache, gemini_semaphore=gemini_semaphore,
+                        tracer=tracer, router=model_router, response_schemas=SECTION_SCHEMAS,
+                        price_history=price_history, price_max_age=reuse_prices_sec,
+                        shared_search=shared_search, pre_scrape=pre_scrape, price_fast_path=price_fast_path,
+                    )
+                    record = {"query": query, **to_jsonable(results)}
+                except Exception as error:
+                    results = {}
+                    record = {"query": query, "error": str(error)}
+                record["elapsed_sec"] = round(time.perf_counter() - started, 2)
+                record["finished_at"] = datetime.now().isoformat(timespec="seconds")
+                # Single event loop, so whole lines never interleave
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if offers_writer is not None:
+                    write_offer_rows(offers_writer, query, results.get("price"), record["finished_at"])
+                    offers_file.flush()
+                if parquet_writer is not None:
+                    parquet_writer.add(query, results.get("price"), record["finished_at"])
+                done_count += 1
+                status = "❌" if "error" in record else "✅"
+                print(f"{status} [{done_count}/{len(pending)}] {query} ({record['elapsed_sec']}s)")
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(concurrency, len(pending)))))
+        finally:
+            pool.close()
+            price_history.close()
+            if offers_file is not None:
+                offers_file.close()
+            if parquet_writer is not None:
+                parquet_writer.close()
+                print(f"🧱 Parquet: {parquet_writer.rows_written} offers written under {parquet_dir}")
+    print(f"🗄️ Tool cache: {session.hits} hits, {session.misses} misses")
+    print(f"🚦 Gemini limiter: {gemini_limiter.stats()}")
+    for row in model_router.summary():
+        print(f"🤖 {row['section']} · {row['model']}: {row['calls']} calls, {row['failures']} failed, "
+              f"avg {row['avg_latency_sec']}s, ${row['cost_usd']:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the three-agent pipeline for many products")
+    parser.add_argument("input", help="CSV or JSONL file of product queries")
+    parser.add_argument("--out", default="results.jsonl", help="JSONL output; existing successful rows are skipped")
+    parser.add_argument("--concurrency", type=int, default=4, help="Products analysed at once")
+    parser.add_argument("--gemini-concurrency", type=int, default=6, help="Gemini requests in flight at once")
+    parser.add_argument("--mcp-concurrency", type=int, default=8, help="Bright Data tool calls in flight at once")
+    parser.add_argument("--pool-size", type=int, default=2, help="MCP server processes to keep open")
+    parser.add_argument("--verbose", action="store_true", help="Print every agent's tool logs")
+    parser.add_argument("--trace", metavar="PATH", help="Append timing spans to this JSONL file")
+    parser.add_argument("--offers", metavar="PATH", help="Also append one CSV row per price offer to this file")
+    parser.add_argument("--parquet", metavar="DIR", help="Also stream price offers into Parquet files partitioned by date and retailer (needs pyarrow)")
+    parser.add_argument("--history", metavar="PATH", help="Price history database (default: PRICE_HISTORY_PATH or .price_history.sqlite)")
+    parser.add_argument("--reuse-prices-min", type=float, default=PRICE_MAX_AGE / 60,
+                        help="Skip retailers with a stored price newer than this many minutes (0 = always re-scrape)")
+    parser.add_argument("--no-shared-search", action="store_true", help="Let every agent run its own first search")
+    parser.add_argument("--pre-scrape", type=int, default=0, help="Scrape this many top search results for all agents up front")
+    parser.add_argument("--no-fast-path", action="store_true",
+                        help="Let the Price agent find every retailer instead of scraping known retailers directly")
+    cli_args = parser.parse_args()
+    asyncio.run(run_batch(
+        read_queries(cli_args.input),
+        cli_args.out,
+        concurrency=cli_args.concurrency,
+        gemini_concurrency=cli_args.gemini_concurrency,
+        mcp_concurrency=cli_args.mcp_concurrency,
+        pool_size=cli_args.pool_size,
+        verbose=cli_args.verbose,
+        trace_path=cli_args.trace,
+        offers_path=cli_args.offers,
+        parquet_dir=cli_args.parquet,
+        history_path=cli_args.history,
+        reuse_prices_sec=cli_args.reuse_prices_min * 60,
+        shared_search=not cli_args.no_shared_search,
+        pre_scrape=cli_args.pre_scrape,
+        price_fast_path=not cli_args.no_fast_path,
+    ))
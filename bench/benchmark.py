@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+# gemini builds its genai.Client at import time; the fake client replaces it before any call
+os.environ.setdefault("GOOGLE_API_KEY", "offline-bench")
+
+import gemini
+from bench.fake_gemini import FakeGeminiClient
+from mcp_pool import SessionProxy
+from price_history import PriceHistory
+from schemas import SECTION_SCHEMAS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fake_server_params(latency_ms, page_kb):
+    return StdioServerParameters(
+        command=sys.executable,
+        args=["-m", "bench.fake_mcp_server"],
+        env={
+            **os.environ,
+            "FAKE_MCP_LATENCY_MS": str(latency_ms),
+            "FAKE_MCP_PAGE_KB": str(page_kb),
+        },
+        cwd=REPO_ROOT,
+    )
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+async def measure(target, concurrency, total, make_call):
+    """Run make_call(i) total times with at most concurrency in flight.
+
+    Latency percentiles and throughput only count calls that succeeded; failures
+    are reported in errors.
+    """
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                await make_call(index)
+            except Exception as error:
+                errors += 1
+                if errors == 1:
+                    print(f"⚠️ {target} call failed: {type(error).__name__}: {error}", file=sys.stderr)
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    result = {
+        "target": target,
+        "concurrency": concurrency,
+        "runs": total,
+        "errors": errors,
+        "elapsed_sec": round(elapsed, 3),
+        "throughput_per_sec": round(len(latencies) / elapsed, 3) if elapsed else None,
+    }
+    for pct in (50, 95, 99):
+        value = percentile(latencies, pct)
+        result[f"p{pct}_ms"] = round(value, 1) if value is not None else None
+    return result
+
+
+def print_result(result):
+    print(
+        f"{result['target']:<22} c={result['concurrency']:<3} n={result['runs']:<4} "
+        f"p50 {result['p50_ms']!s:>8} ms  p95 {result['p95_ms']!s:>8} ms  p99 {result['p99_ms']!s:>8} ms  "
+        f"{result['throughput_per_sec']!s:>7}/s  errors {result['errors']}"
+    )
+
+
+class _BareStatus:
+    """st.status stand-in: outside a script run st.status is a plain container without update()."""
+
+    def __init__(self, streamlit):
+        self._container = streamlit.container()
+
+    def update(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._container, name)
+
+
+class _BareStreamlit:
+    """The streamlit module with st.status swapped for _BareStatus."""
+
+    def __init__(self, streamlit):
+        self._streamlit = streamlit
+
+    def status(self, label, **kwargs):
+        return _BareStatus(self._streamlit)
+
+    def __getattr__(self, name):
+        return getattr(self._streamlit, name)
+
+
+def _load_execute_multi_agent(session):
+    """Import the Streamlit app headless with its MCP pool pointed at our session, if streamlit is installed."""
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            import shopping_app
+    except ImportError:
+        return None
+
+    class _InitializedSession(SessionProxy):
+        async def initialize(self):
+            return None  # already done by run_benchmarks
+
+    class _Pool:
+        def session(self):
+            return _InitializedSession(session)
+
+    shopping_app.get_mcp_pool = lambda: _Pool()
+    # Keep benchmark prices out of the real price history
+    history = PriceHistory(":memory:")
+    shopping_app.get_price_history = lambda: history
+    shopping_app.st = _BareStreamlit(shopping_app.st)
+    return shopping_app.execute_multi_agent
+
+
+async def run_benchmarks(levels, runs, targets, server_params, hedge=False):
+    results = []
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+
+            if "run_agent_task" in targets:
+                async def agent_call(index):
+                    await gemini.run_agent_task(
+                        session, "Price & Availability", f"bench product {index}", gemini.PRICE_GOAL,
+                        logger=gemini.quiet_logger, hedge_policy=gemini.gemini_hedging if hedge else None,
+                    )
+                for level in levels:
+                    results.append(await measure("run_agent_task", level, runs, agent_call))
+                    print_result(results[-1])
+
+            if "price_fast_path" in targets:
+                price_agent = [agent for agent in gemini.AGENTS if agent[0] == "price"]
+
+                async def fast_path_call(index):
+                    await gemini.run_agents(
+                        session, f"bench product {index}", price_agent, loggers={"price": gemini.quiet_logger},
+                        response_schemas=SECTION_SCHEMAS, price_fast_path=True,
+                    )
+                for level in levels:
+                    results.append(await measure("price_fast_path", level, runs, fast_path_call))
+                    print_result(results[-1])
+
+            if "execute_multi_agent" in targets:
+                execute_multi_agent = _load_execute_multi_agent(session)
+                if execute_multi_agent is None:
+                    print("execute_multi_agent     skipped (streamlit is not installed)")
+                else:
+                    async def multi_call(index):
+                        await execute_multi_agent(f"bench product {index}", enable_logs=False, use_cache=False)
+                    for level in levels:
+                        # Without log boxes the agents print their progress; keep it out of the report
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            results.append(await measure("execute_multi_agent", level, runs, multi_call))
+                        print_result(results[-1])
+
+    if "gemini.run" in targets:
+        # The CLI workflow spawns its own MCP server per run, like the real thing
+        gemini.server_params = server_params
+
+        async def cli_call(index):
+            await gemini.run()
+        for level in levels:
+            # One redirect around all the concurrent runs: overlapping per-call redirects
+            # can restore each other's StringIO and leave stdout swallowed
+            with contextlib.redirect_stdout(io.StringIO()):
+                results.append(await measure("gemini.run", level, max(1, runs // 4), cli_call))
+            print_result(results[-1])
+    return results
+
+
+def compare(report, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(row["target"], row["concurrency"]): row for row in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for row in report["results"]:
+        old = baseline.get((row["target"], row["concurrency"]))
+        if not old:
+            continue
+        deltas = []
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_per_sec"):
+            if old.get(metric) and row.get(metric) is not None:
+                deltas.append(f"{metric} {100 * (row[metric] - old[metric]) / old[metric]:+.1f}%")
+        print(f"{row['target']:<22} c={row['concurrency']:<3} " + "  ".join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against a fake Gemini client and a fake MCP server")
+    parser.add_argument("--levels", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--runs", type=int, default=32, help="Calls per target and level")
+    parser.add_argument("--targets", default="run_agent_task,price_fast_path,execute_multi_agent,gemini.run")
+    parser.add_argument("--model-latency-ms", type=float, default=800)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of model calls failing with 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of model turns that are slow")
+    parser.add_argument("--slow-factor", type=float, default=5.0)
+    parser.add_argument("--hedge", action="store_true", help="Hedge slow model requests in the run_agent_task target")
+    parser.add_argument("--mcp-latency-ms", type=float, default=300)
+    parser.add_argument("--page-kb", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default="bench_report.json")
+    parser.add_argument("--compare", metavar="REPORT", help="Earlier report to diff against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    gemini.client = FakeGeminiClient(
+        latency_ms=args.model_latency_ms,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+        slow_factor=args.slow_factor,
+    )
+    levels = [int(level) for level in args.levels.split(",")]
+    targets = set(args.targets.split(","))
+    server_params = fake_server_params(args.mcp_latency_ms, args.page_kb)
+
+    results = asyncio.run(run_benchmarks(levels, args.runs, targets, server_params, hedge=args.hedge))
+
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+        ).stdout.strip()
+    except OSError:
+        revision = None
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": revision,
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📄 Report written to {args.out}")
+    if args.compare:
+        compare(report, args.compare)
+    failed = [row for row in results if row["runs"] and row["errors"] == row["runs"]]
+    if failed:
+        names = ", ".join(f"{row['target']} c={row['concurrency']}" for row in failed)
+        sys.exit(f"❌ Every call failed for {names}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+# Tool calls the fake model makes per section before answering; "{query}" is filled in
+DEFAULT_TOOL_PLAN = {
+    "Product Profile": [
+        ("search_engine", {"query": "{query} specifications"}),
+        ("scrape_as_markdown", {"url": "https://www.amazon.in/{slug}/p/1"}),
+    ],
+    "Price & Availability": [
+        ("search_engine", {"query": "{query} price india"}),
+        ("scrape_as_markdown", {"url": "https://www.amazon.in/{slug}/p/1"}),
+        ("scrape_as_markdown", {"url": "https://www.flipkart.com/{slug}/p/1"}),
+        ("scrape_as_markdown", {"url": "https://www.croma.com/{slug}/p/1"}),
+    ],
+    "Trending News & Social Buzz": [
+        ("search_engine", {"query": "{query} news memes"}),
+    ],
+}
+
+
+class FakeServerError(Exception):
+    """Shaped like google.genai.errors.ServerError for the retry paths."""
+
+    def __init__(self, code=503, message="The model is overloaded. Please try again later."):
+        super().__init__(f"{code} UNAVAILABLE. {message}")
+        self.code = code
+        self.status = "UNAVAILABLE"
+        self.message = message
+
+
+def _text_part(text):
+    return SimpleNamespace(text=text, function_call=None, function_response=None)
+
+
+def _call_part(name, args):
+    return SimpleNamespace(text=None, function_call=SimpleNamespace(id=None, name=name, args=args), function_response=None)
+
+
+def _sample_json(schema, defs):
+    """A small value shaped like a JSON schema, for answering structured-output calls."""
+    if "$ref" in schema:
+        return _sample_json(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+    if "anyOf" in schema:
+        return _sample_json(next((option for option in schema["anyOf"] if option.get("type") != "null"), {}), defs)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _sample_json(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_sample_json(schema.get("items", {}), defs)]
+    if kind in ("number", "integer"):
+        return 49999
+    if kind == "boolean":
+        return True
+    return "Canned benchmark value"
+
+
+def _iter_content_parts(contents):
+    for content in contents:
+        yield from getattr(content, "parts", None) or []
+
+
+def _response(parts, prompt_tokens, output_tokens):
+    text = "".join(part.text or "" for part in parts)
+    return SimpleNamespace(
+        text=text,
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))],
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        ),
+    )
+
+
+class FakeModels:
+    def __init__(self, config):
+        self.config = config
+        self.calls = 0
+
+    async def _turn_latency(self):
+        config = self.config
+        latency = config["latency_ms"] * random.uniform(0.8, 1.2)
+        if random.random() < config["slow_rate"]:
+            latency *= config["slow_factor"]
+        await asyncio.sleep(latency / 1000)
+
+    async def _turn(self, contents, config):
+        """One turn of a caller-driven tool loop: the first planned call, then all the rest at once, then the answer."""
+        self.calls += 1
+        if random.random() < self.config["error_rate"]:
+            await asyncio.sleep(self.config["latency_ms"] / 4000)
+            raise FakeServerError()
+        parts = list(_iter_content_parts(contents))
+        prompt = next((part.text for part in parts if getattr(part, "text", None)), "")
+        section = next((name for name in self.config["tool_plan"] if f"You are the {name} agent" in prompt), None)
+        query = prompt.split("User query:", 1)[-1].split("\n", 2)[0].strip() or "product"
+        slug = "-".join(query.lower().split())[:60]
+        plan = self.config["tool_plan"].get(section, [])
+        answered = sum(1 for part in parts if getattr(part, "function_response", None) is not None)
+        prompt_tokens = sum(len(str(part)) for part in parts) // 4
+        await self._turn_latency()
+
+        mode = getattr(getattr(getattr(config, "tool_config", None), "function_calling_config", None), "mode", None)
+        if answered < len(plan) and mode != "NONE":
+            batch = plan[answered:answered + 1] if answered == 0 else plan[answered:]
+            return [
+                _call_part(name, {key: value.format(query=query, slug=slug) for key, value in args.items()})
+                for name, args in batch
+            ], prompt_tokens
+        answer = f"## {section or 'Answer'} for {query}\n\n" + "Canned benchmark answer. " * self.config["answer_words"]
+        return [_text_part(answer)], prompt_tokens
+
+    async def _structured(self, contents, config):
+        """A response_schema call: schema-shaped JSON, as Gemini's JSON mode would return."""
+        self.calls += 1
+        if random.random() < self.config["error_rate"]:
+            await asyncio.sleep(self.config["latency_ms"] / 4000)
+            raise FakeServerError()
+        await self._turn_latency()
+        schema = config.response_schema
+        if isinstance(schema, type):
+            schema = schema.model_json_schema()
+        answer = json.dumps(_sample_json(schema, schema.get("$defs", {})))
+        return [_text_part(answer)], len(str(contents)) // 4
+
+    async def _respond(self, contents, config):
+        if getattr(config, "response_mime_type", None) == "application/json":
+            return await self._structured(contents, config)
+        return await self._turn(contents, config)
+
+    async def generate_content(self, model, contents, config=None):
+        parts, prompt_tokens = await self._respond(contents, config)
+        output_tokens = sum(len(str(part)) for part in parts) // 4
+        return _response(parts, prompt_tokens, output_tokens)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        parts, prompt_tokens = await self._respond(contents, config)
+
+        async def chunks():
+            for part in parts:
+                if part.text is None:
+                    yield _response([part], prompt_tokens, len(str(part)) // 4)
+                    continue
+                step = max(1, len(part.text) // 8)
+                for start in range(0, len(part.text), step):
+                    await asyncio.sleep(0.01)
+                    yield _response([_text_part(part.text[start:start + step])], prompt_tokens, (start + step) // 4)
+
+        return chunks()
+
+
+class FakeGeminiClient:
+    """Drop-in for genai.Client with configurable latency, tool-call pattern and errors.
+
+    Only the aio.models.generate_content and generate_content_stream surface that
+    gemini.run_agent_task uses is provided. It answers one turn at a time with the
+    section's planned function calls, then with a canned answer, and answers
+    response_schema calls with schema-shaped JSON.
+    """
+
+    def __init__(self, latency_ms=800, error_rate=0.0, slow_rate=0.0, slow_factor=5.0, tool_plan=None,
+                 answer_words=60):
+        self.config = {
+            "latency_ms": latency_ms,
+            "error_rate": error_rate,
+            "slow_rate": slow_rate,
+            "slow_factor": slow_factor,
+            "tool_plan": tool_plan or DEFAULT_TOOL_PLAN,
+            "answer_words": answer_words,
+        }
+        self.aio = SimpleNamespace(models=FakeModels(self.config))
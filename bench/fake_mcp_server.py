@@ -0,0 +1,111 @@
+"""Local stdio MCP server that mimics the Bright Data tools with canned pages.
+
+Run with `python -m bench.fake_mcp_server`. FAKE_MCP_LATENCY_MS sets the per-call
+delay and FAKE_MCP_PAGE_KB pads scraped pages to roughly that size, so runs are
+reproducible without network access or API quota.
+"""
+import asyncio
+import json
+import os
+import random
+from urllib.parse import urlparse
+
+from mcp.server.fastmcp import FastMCP
+
+LATENCY_MS = float(os.environ.get("FAKE_MCP_LATENCY_MS", "300"))
+PAGE_KB = int(os.environ.get("FAKE_MCP_PAGE_KB", "50"))
+
+RETAILERS = {
+    "www.amazon.in": ("Amazon", 52999),
+    "www.flipkart.com": ("Flipkart", 51499),
+    "www.reliancedigital.in": ("Reliance Digital", 53990),
+    "www.croma.com": ("Croma", 52490),
+    "www.vijaysales.com": ("Vijay Sales", 51990),
+}
+
+# Product URL paths and price blocks shaped like each store's, so retailers.py can
+# resolve and parse them; "{slug}" is the query
+PRODUCT_PATHS = {
+    "www.amazon.in": "/{slug}/dp/B0CGXXXXXX",
+    "www.flipkart.com": "/{slug}/p/itm123abc",
+    "www.reliancedigital.in": "/{slug}/p/493839",
+    "www.croma.com": "/{slug}/p/300900",
+    "www.vijaysales.com": "/{slug}/23456",
+}
+PRICE_BLOCKS = {
+    "www.amazon.in": "M.R.P.: ₹{mrp:,}\nDeal Price: ₹{price:,}",
+    "www.flipkart.com": "₹3,000 off on HDFC Bank cards\nSpecial price\n₹{price:,}",
+    "www.reliancedigital.in": "Offer Price: ₹{price:,}\nM.R.P.: ₹{mrp:,}",
+    "www.croma.com": "₹{price:,}\nMRP ₹{mrp:,}",
+    "www.vijaysales.com": "Special Price ₹{price:,}\nEMI from ₹2,499/month",
+}
+
+BOILERPLATE = (
+    "[Home](/) | [Mobiles](/mobiles) | [Electronics](/electronics) | [Offers](/offers) | [Sign in](/login)\n"
+    "Free delivery on orders above ₹499 · Cookie settings · Download the app · Gift cards · Help centre\n"
+)
+
+mcp = FastMCP("fake-brightdata")
+
+
+async def _delay():
+    # Jittered so percentiles are not all identical
+    await asyncio.sleep(LATENCY_MS / 1000 * random.uniform(0.7, 1.3))
+
+
+def _slug(text):
+    return "-".join(text.lower().split())[:60]
+
+
+@mcp.tool()
+async def search_engine(query: str, engine: str = "google") -> str:
+    """Scrape search results from Google, Bing or Yandex"""
+    await _delay()
+    lines = [f"# Search results for {query} ({engine})", ""]
+    for host, (name, _) in RETAILERS.items():
+        path = PRODUCT_PATHS[host].format(slug=_slug(query))
+        lines.append(f"- [{query} - {name}](https://{host}{path}) — Buy {query} online at {name}")
+    lines.append(f"- [{query} review](https://www.gsmarena.com/{_slug(query)}-review.php) — Full review")
+    lines.append(f"- [{query} memes are everywhere](https://www.reddit.com/r/india/{_slug(query)}) — Social buzz")
+    return "\n".join(lines)
+
+
+@mcp.tool()
+async def scrape_as_markdown(url: str) -> str:
+    """Scrape a single webpage and return its content as markdown"""
+    await _delay()
+    host = urlparse(url).netloc
+    name, price = RETAILERS.get(host, (host, 49999))
+    body = [
+        BOILERPLATE,
+        f"# Product page on {name}",
+        PRICE_BLOCKS.get(host, "**Price:** ₹{price:,}").format(price=price, mrp=round(price * 1.15)),
+        "**Availability:** In stock",
+        "**Delivery:** Get it by tomorrow",
+        f"**Sold by:** {name} Retail",
+        "## Specifications",
+        "- Display: 6.2 inch OLED, 120 Hz",
+        "- Chip: Tensor G3",
+        "- Storage: 128 GB",
+    ]
+    page = "\n".join(body) + "\n"
+    filler = BOILERPLATE * max(1, (PAGE_KB * 1024) // len(BOILERPLATE))
+    return page + filler
+
+
+@mcp.tool()
+async def web_data_amazon_product(url: str) -> str:
+    """Quickly read structured Amazon product data"""
+    await _delay()
+    return json.dumps({
+        "url": url,
+        "title": "Google Pixel 8 (Obsidian, 8GB RAM, 128GB Storage)",
+        "final_price": RETAILERS["www.amazon.in"][1],
+        "currency": "INR",
+        "availability": "In stock",
+        "seller_name": "Amazon Retail",
+    })
+
+
+if __name__ == "__main__":
+    mcp.run()
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from mcp_pool import SessionProxy
+
+# Seconds a cached agent answer stays fresh, per section: specs barely change,
+# prices move within the hour and news within the day.
+SECTION_TTLS = {
+    "Product Profile": 7 * 24 * 3600,
+    "Price & Availability": 15 * 60,
+    "Trending News & Social Buzz": 6 * 3600,
+}
+DEFAULT_TTL = 3600
+TOOL_CACHE_TTL = 10 * 60
+
+
+def normalize_query(query):
+    return " ".join(str(query).lower().split())
+
+
+def make_cache_key(*parts):
+    """Stable key for any JSON-serializable parts."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """Thread-safe in-memory LRU cache with per-entry TTL."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def set(self, key, value, ttl=DEFAULT_TTL, expires_at=None):
+        with self._lock:
+            self._entries[key] = (value, expires_at or time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SqliteCache:
+    """On-disk cache that survives restarts; values must be JSON-serializable."""
+
+    def __init__(self, path=".agent_cache.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def get_entry(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def set(self, key, value, ttl=DEFAULT_TTL, expires_at=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at or time.time() + ttl),
+            )
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+
+class TieredCache:
+    """Memory in front of disk; disk hits are promoted with their remaining TTL."""
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+
+    def get_entry(self, key):
+        entry = self.memory.get_entry(key)
+        if entry is None:
+            entry = self.disk.get_entry(key)
+            if entry is not None:
+                self.memory.set(key, entry[0], expires_at=entry[1])
+        return entry
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def set(self, key, value, ttl=DEFAULT_TTL, expires_at=None):
+        self.memory.set(key, value, ttl, expires_at)
+        self.disk.set(key, value, ttl, expires_at)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.clear()
+
+
+def make_result_cache(backend=None, path=None):
+    """Build the agent result cache from AGENT_CACHE (memory | sqlite | off)."""
+    backend = (backend or os.environ.get("AGENT_CACHE", "memory")).lower()
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        path = path or os.environ.get("AGENT_CACHE_PATH", ".agent_cache.sqlite")
+        return TieredCache(MemoryCache(), SqliteCache(path))
+    return MemoryCache()
+
+
+class CachingSession(SessionProxy):
+    """Memoizes Bright Data tool calls by tool name and canonicalized arguments.
+
+    Concurrent identical calls are single-flighted: the first caller scrapes and
+    the rest await its result, so two agents asking for the same URL at the same
+    moment cost one scrape. Error results are never cached.
+    """
+
+    def __init__(self, inner, store=None, ttl=TOOL_CACHE_TTL):
+        super().__init__(inner)
+        self.store = store if store is not None else MemoryCache(max_entries=256)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._in_flight = {}
+
+    async def call_tool(self, name, arguments=None, *args, **kwargs):
+        key = make_cache_key("tool", name, arguments or {})
+        while True:
+            cached = self.store.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+            try:
+                result = await asyncio.shield(pending)
+                self.hits += 1
+                return result
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The caller doing the scrape gave up; take over from it
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await super().call_tool(name, arguments, *args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            future.exception()  # followers re-raise it; don't warn when there are none
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+        if not getattr(result, "isError", False):
+            self.store.set(key, result, self.ttl)
+        future.set_result(result)
+        return result
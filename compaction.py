@@ -0,0 +1,199 @@
+import json
+import os
+import re
+
+from mcp.types import TextContent
+
+from mcp_pool import SessionProxy
+from telemetry import NULL_TRACER
+
+# Token budget per tool result; whole pages are cut to their price, spec and article blocks
+TOOL_TOKEN_BUDGETS = {
+    "scrape_as_markdown": 3000,
+    "scrape_as_html": 3000,
+    "search_engine": 1500,
+}
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("TOOL_TOKEN_BUDGET", "4000"))
+
+# Tools whose output is prose/markdown and can have boilerplate stripped; anything
+# else (e.g. structured web_data_* JSON) is only truncated to its budget
+MARKDOWN_TOOLS = {"scrape_as_markdown", "scrape_as_html", "search_engine"}
+# Search results are lists of links, so their URLs are the content
+KEEP_LINK_TOOLS = {"search_engine"}
+# Shortest piece of an over-long line worth keeping once the budget is nearly spent
+MIN_CLIPPED_LINE = 80
+# Longest string kept whole when a JSON tool result is over budget
+JSON_STRING_LIMIT = 400
+
+_PRICE_RE = re.compile(r"(₹|\brs\.?|\binr\b|\$|€|£|\bmrp\b)\s?\d|\d[\d,]*(\.\d+)?\s?(₹|\binr\b)", re.I)
+_STOCK_RE = re.compile(
+    r"in stock|out of stock|sold out|currently unavailable|deliver|dispatch|ships? (in|by|within)|sold by|seller|"
+    r"warranty|\bemi\b|% off|discount|bank offer",
+    re.I,
+)
+_SPEC_RE = re.compile(r"^\s*(\|.+\||[-*•]?\s*[\w ()/.-]{2,40}\s*[:：]\s*\S)")
+_BOILERPLATE_RE = re.compile(
+    r"cookie|sign in|log ?in|sign up|create account|privacy policy|terms of (use|service)|all rights reserved|"
+    r"copyright|©|subscribe|newsletter|follow us|download (the|our) app|skip to (main )?content|help cent(er|re)|"
+    r"customer (care|service)|track (your )?order|gift card|back to top|become a seller|advertise",
+    re.I,
+)
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_LINK_RE = re.compile(r"\[([^\]]*)\]\(([^)\s]*)[^)]*\)")
+_LINK_ONLY_RE = re.compile(r"^\s*([-*•]\s*)?(\[[^\]]*\]\([^)]*\)[\s|·•,/-]*)+$")
+
+
+def estimate_tokens(text):
+    # Gemini averages about four characters per token on scraped English pages
+    return (len(text) + 3) // 4
+
+
+def _score(line):
+    if _PRICE_RE.search(line):
+        return 3
+    if _STOCK_RE.search(line) or _SPEC_RE.match(line):
+        return 2
+    if line.lstrip().startswith("#") or len(line.split()) >= 12:
+        return 1
+    return 0
+
+
+def strip_boilerplate(text, keep_links=False):
+    """Drop images, navigation link lists, boilerplate and repeated lines from scraped markdown."""
+    kept = []
+    seen = set()
+    for raw in text.splitlines():
+        line = _IMAGE_RE.sub("", raw).rstrip()
+        if not line.strip():
+            if kept and kept[-1]:
+                kept.append("")
+            continue
+        if not keep_links:
+            if _LINK_ONLY_RE.match(line):
+                continue  # menus, breadcrumbs and footers are rows of bare links
+            # Prices keep their link so the agent can cite the buying URL
+            line = _LINK_RE.sub(r"\1 (\2)" if _PRICE_RE.search(line) else r"\1", line)
+        stripped = line.strip()
+        if len(stripped) < 3 or len(stripped) < 160 and _BOILERPLATE_RE.search(stripped):
+            continue
+        if stripped in seen:
+            continue
+        seen.add(stripped)
+        kept.append(line)
+    return "\n".join(kept).strip()
+
+
+def fit_budget(text, max_tokens):
+    """Keep the highest-value lines (prices, then stock/specs, then prose) within max_tokens, in page order."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    budget = max_tokens * 4
+    order = sorted(range(len(lines)), key=lambda index: -_score(lines[index]))
+    chosen = {}
+    used = 0
+    for index in order:
+        line = lines[index]
+        room = budget - used - 1
+        if len(line) > room:
+            # A single long line (often the price line itself) is cut down rather than lost
+            if room < MIN_CLIPPED_LINE:
+                continue
+            line = line[:room - 1] + "…"
+        chosen[index] = line
+        used += len(line) + 1
+    kept = "\n".join(chosen[index] for index in sorted(chosen) if chosen[index].strip())
+    omitted = len(text) - len(kept)
+    return f"{kept}\n\n[… {omitted:,} characters of lower-value page content omitted]"
+
+
+def _clip_strings(value, limit):
+    if isinstance(value, dict):
+        return {key: _clip_strings(item, limit) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clip_strings(item, limit) for item in value]
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit] + "…"
+    return value
+
+
+def truncate(text, max_tokens):
+    """Hold a structured payload to max_tokens without reading it line by line.
+
+    JSON first has its long strings (descriptions, reviews) clipped so short fields
+    such as prices survive; whatever is still over budget is cut from the end.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    try:
+        text = json.dumps(_clip_strings(json.loads(text), JSON_STRING_LIMIT), ensure_ascii=False)
+    except ValueError:
+        pass
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept = text[:max_tokens * 4]
+    return f"{kept}\n\n[… {len(text) - len(kept):,} characters truncated]"
+
+
+def compact_text(tool, text, max_tokens=None):
+    if max_tokens is None:
+        max_tokens = TOOL_TOKEN_BUDGETS.get(tool, DEFAULT_TOKEN_BUDGET)
+    if tool not in MARKDOWN_TOOLS:
+        # Structured web_data_* results are usually one line of JSON; line scoring would drop all of it
+        return truncate(text, max_tokens)
+    text = strip_boilerplate(text, keep_links=tool in KEEP_LINK_TOOLS)
+    return fit_budget(text, max_tokens)
+
+
+class CompactingSession(SessionProxy):
+    """Shrinks tool results before they reach the model.
+
+    Scraped pages lose navigation and boilerplate and are cut to a per-tool token
+    budget, keeping price, stock, spec and article lines first. Each call records
+    a "compact" span with the bytes and estimated tokens saved; the running totals
+    are on the session.
+    """
+
+    def __init__(self, inner, tracer=None, budgets=None):
+        super().__init__(inner)
+        self.tracer = tracer or NULL_TRACER
+        self.budgets = {**TOOL_TOKEN_BUDGETS, **(budgets or {})}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tokens_saved = 0
+
+    async def call_tool(self, name, arguments=None, *args, **kwargs):
+        result = await super().call_tool(name, arguments, *args, **kwargs)
+        if getattr(result, "isError", False) or not result.content:
+            return result
+        with self.tracer.span("compact", tool=name) as span:
+            before = after = tokens_saved = 0
+            content = []
+            for item in result.content:
+                text = getattr(item, "text", None)
+                if text is None:
+                    content.append(item)
+                    continue
+                compacted = compact_text(name, text, self.budgets.get(name, DEFAULT_TOKEN_BUDGET))
+                before += len(text.encode("utf-8"))
+                after += len(compacted.encode("utf-8"))
+                tokens_saved += estimate_tokens(text) - estimate_tokens(compacted)
+                content.append(TextContent(type="text", text=compacted))
+            span.set(
+                bytes_before=before,
+                bytes_after=after,
+                bytes_saved=before - after,
+                tokens_saved=tokens_saved,
+            )
+        self.bytes_in += before
+        self.bytes_out += after
+        self.tokens_saved += tokens_saved
+        return result.model_copy(update={"content": content})
+
+    def stats(self):
+        return {
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+            "tokens_saved": self.tokens_saved,
+        }
@@ -1,22 +1,122 @@
 import os
+import argparse
 from dotenv import load_dotenv
 load_dotenv()
 import asyncio
+import contextlib
+import fnmatch
+import re
+import threading
+import time
 from datetime import datetime
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from google import genai
 import json
+from cache import DEFAULT_TTL, SECTION_TTLS, CachingSession, make_cache_key, make_result_cache, normalize_query
+from compaction import CompactingSession
+from hedging import HedgePolicy
+from mcp_pool import LimitedSession, TimeoutSession
+from model_router import ModelRouter
+from ratelimit import AdaptiveLimiter
+from retry import DEFAULT_RETRY_POLICY, is_overload_error
+from price_history import PRICE_MAX_AGE, PRICE_RETAILERS, merge_offers, narrow_price_goal
+from retailers import direct_price_offers
+from schemas import SECTION_SCHEMAS, PriceComparison, to_jsonable, to_markdown
+from telemetry import NULL_TRACER, Tracer, TracingSession, usage_attributes
 
 client = genai.Client(api_key=os.environ.get("GOOGLE_API_KEY", ""))
 
-def log_realtime(step_name, data=""):
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# Picks a model per section and falls back to another one while a model is overloaded
+model_router = ModelRouter()
+
+# Optional hedging shared by all agents so it learns their latency distributions;
+# GEMINI_HEDGE_MODEL names a faster model to send the hedge to
+gemini_hedging = HedgePolicy(fallback_model=os.environ.get("GEMINI_HEDGE_MODEL") or None)
+
+# Seconds an agent may run before it is cut off with whatever it has, and seconds a
+# single Bright Data tool call may take before the model is told it failed
+AGENT_TIMEOUT = float(os.environ.get("AGENT_TIMEOUT_SEC", "150"))
+TOOL_CALL_TIMEOUT = float(os.environ.get("TOOL_CALL_TIMEOUT_SEC", "45"))
+
+# Budget of one agent's tool loop: model turns, tool calls in total, and tool calls
+# from a single turn that run against the MCP session at the same time
+MAX_AGENT_TURNS = int(os.environ.get("AGENT_MAX_TURNS", "8"))
+MAX_TOOL_CALLS = int(os.environ.get("AGENT_MAX_TOOL_CALLS", "16"))
+TOOL_CALLS_PER_TURN = int(os.environ.get("TOOL_CALLS_PER_TURN", "4"))
+
+# Bright Data tools each section may use (fnmatch patterns). Fewer declarations mean
+# a smaller prompt, and keeping the slow scraping_browser_* tools out means the
+# model can't pick them. Sections not listed here see every tool.
+SECTION_TOOLS = {
+    "Product Profile": ["search_engine", "scrape_as_markdown", "web_data_*_product"],
+    "Price & Availability": ["search_engine", "scrape_as_markdown", "web_data_*_product"],
+    "Trending News & Social Buzz": ["search_engine*"],
+}
+
+# Every agent and batch worker in this process goes through one limiter, so the
+# Gemini quota is shared instead of each caller backing off on its own
+gemini_limiter = AdaptiveLimiter(
+    max_concurrency=int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8")),
+    rate=float(os.environ["GEMINI_MAX_RPS"]) if os.environ.get("GEMINI_MAX_RPS") else None,
+)
+
+# Default number of characters of a tool payload shown in the logs
+LOG_JSON_LIMIT = 1000
+
+def _iter_json(value, limit, indent=2, level=0):
+    """Yield indented JSON for value piece by piece, clipping strings to limit characters"""
+    pad = " " * (indent * (level + 1))
+    if isinstance(value, dict):
+        if not value:
+            yield "{}"
+            return
+        yield "{"
+        for i, (key, item) in enumerate(value.items()):
+            yield ("," if i else "") + "\n" + pad + json.dumps(str(key), ensure_ascii=False) + ": "
+            yield from _iter_json(item, limit, indent, level + 1)
+        yield "\n" + " " * (indent * level) + "}"
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            yield "[]"
+            return
+        yield "["
+        for i, item in enumerate(value):
+            yield ("," if i else "") + "\n" + pad
+            yield from _iter_json(item, limit, indent, level + 1)
+        yield "\n" + " " * (indent * level) + "]"
+    elif value is None or isinstance(value, (bool, int, float)):
+        yield json.dumps(value)
+    else:
+        # Scraped pages arrive as one huge string; only encode the part that can be shown
+        yield json.dumps(str(value)[: limit + 1], ensure_ascii=False)
+
+def format_json_bounded(data, limit=LOG_JSON_LIMIT):
+    """Pretty-print data as JSON, stopping as soon as limit characters have been produced"""
+    parts = []
+    size = 0
+    for piece in _iter_json(data, limit):
+        parts.append(piece)
+        size += len(piece)
+        if size > limit:
+            return "".join(parts)[:limit] + "..."
+    return "".join(parts)
+
+def quiet_logger(text):
+    """A run_agent_task logger that drops everything, for batch and benchmark runs."""
+
+# Tell run_agent_task not to serialize tool payloads nobody will read
+quiet_logger.json_limit = 0
+
+def log_realtime(step_name, data="", limit=LOG_JSON_LIMIT):
     """Log real-time tool execution with actual results"""
     timestamp = datetime.now().strftime("%H:%M:%S")
     print(f"\n🔄 [{timestamp}] {step_name}")
     if data:
         print(f"📊 RESULT:")
-        print(json.dumps(data, indent=2, ensure_ascii=False)[:1000] + ("..." if len(str(data)) > 1000 else ""))
+        print(format_json_bounded(data, limit))
     print("-" * 60)
 
 # Create server parameters for stdio connection
@@ -28,7 +128,314 @@ server_params = StdioServerParameters(
     },  # Optional environment variables
 )
 
-async def run_agent_task(session, section_name, user_query, system_goal, logger=None):
+# Multi-agent workflow
+PRODUCT_GOAL = (
+    "Collect full product profile: official images, title, key specs, variants, dimensions, weight, materials, warranty, box contents. Prefer official sources. Provide clean summary and source links. from indian e commerce sites only."
+)
+PRICE_GOAL = (
+    "Find availability across major Indian e-commerce sites (Amazon, Flipkart, Reliance, Croma, Vijay Sales, official store) and PROVIDE THE BUYING LINK. For each: price, currency, stock status, shipping ETA, seller, warranty notes, URL. Output a concise comparison."
+)
+NEWS_GOAL = (
+    "Summarize recent trending news, memes, launch rumors, controversies, major reviews about the product. Include dates, sources, and brief takeaways."
+)
+AGENTS = [
+    ("product", "Product Profile", PRODUCT_GOAL),
+    ("price", "Price & Availability", PRICE_GOAL),
+    ("news", "Trending News & Social Buzz", NEWS_GOAL),
+]
+
+def _iter_parts(response):
+    """Yield (candidate_index, part_index, part) for every part of a model response"""
+    for i, candidate in enumerate(getattr(response, 'candidates', None) or []):
+        if getattr(candidate, 'content', None) and candidate.content.parts:
+            for j, part in enumerate(candidate.content.parts):
+                yield i, j, part
+
+async def _stream_response(model, contents, config, on_event, text_parts, call_parts):
+    """Stream one generate call, reporting text deltas as they arrive.
+
+    Text is collected into the caller's text_parts so a timed-out run keeps what it
+    had; function-call parts (which arrive whole) go to call_parts.
+    """
+    usage = None
+    async for chunk in await client.aio.models.generate_content_stream(model=model, contents=contents, config=config):
+        # Usage is cumulative, so the last chunk that carries it has the totals
+        usage = getattr(chunk, 'usage_metadata', None) or usage
+        for i, _, part in _iter_parts(chunk):
+            if i:
+                continue
+            if getattr(part, 'function_call', None) is not None:
+                call_parts.append(part)
+            elif getattr(part, 'text', None):
+                text_parts.append(part.text)
+                on_event({"type": "text", "text": part.text})
+    return usage
+
+class ToolCatalogue:
+    """The MCP server's tools as Gemini function declarations, listed once and reused.
+
+    Every agent in the process talks to the same Bright Data server, so the first
+    list_tools answer is kept for ttl seconds and each agent picks its allowlisted
+    tools from it.
+    """
+
+    def __init__(self, ttl=3600.0):
+        self.ttl = ttl
+        self._declarations = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    async def all(self, session):
+        with self._lock:
+            if self._declarations is not None and time.monotonic() - self._fetched_at < self.ttl:
+                return self._declarations
+        listed = await session.list_tools()
+        declarations = [
+            genai.types.FunctionDeclaration(
+                name=tool.name,
+                description=tool.description or "",
+                parameters_json_schema=tool.inputSchema,
+            )
+            for tool in listed.tools
+        ]
+        with self._lock:
+            self._declarations, self._fetched_at = declarations, time.monotonic()
+        return declarations
+
+    async def declarations(self, session, allowed=None):
+        """Declarations whose names match one of the allowed patterns (all of them when allowed is None)."""
+        declarations = await self.all(session)
+        if allowed is None:
+            return declarations
+        chosen = [
+            declaration for declaration in declarations
+            if any(fnmatch.fnmatchcase(declaration.name, pattern) for pattern in allowed)
+        ]
+        # An allowlist written for another server must not leave the agent without tools
+        return chosen or declarations
+
+    def clear(self):
+        with self._lock:
+            self._declarations = None
+
+tool_catalogue = ToolCatalogue()
+
+SEARCH_TOOL = "search_engine"
+SCRAPE_TOOL = "scrape_as_markdown"
+# Characters of each pre-scraped page put into the shared context
+GROUNDING_PAGE_CHARS = 6000
+
+_URL_RE = re.compile(r"https?://[^\s)\]>\"']+")
+_SEARCH_ENGINE_HOSTS = ("google.", "gstatic.", "googleusercontent.", "bing.", "duckduckgo.", "youtube.com/results")
+
+def search_result_urls(serp_text, limit):
+    """First distinct result URLs in a search results page, skipping the search engine's own links."""
+    urls = []
+    for url in _URL_RE.findall(serp_text):
+        url = url.rstrip(".,;")
+        if any(host in url for host in _SEARCH_ENGINE_HOSTS) or url in urls:
+            continue
+        urls.append(url)
+        if len(urls) >= limit:
+            break
+    return urls
+
+async def gather_grounding(session, user_query, pre_scrape=0, tracer=None):
+    """Run one web search for the query, optionally scrape its top pre_scrape results in
+    parallel, and return the lot as prompt context shared by every agent."""
+    tracer = tracer or NULL_TRACER
+    with tracer.span("shared_search", pre_scrape=pre_scrape) as span:
+        try:
+            result = await session.call_tool(SEARCH_TOOL, {"query": user_query})
+        except Exception as error:
+            # An unavailable session or broken pipe must not fail the report; agents search on their own
+            serp = {"error": f"{type(error).__name__}: {error}"}
+        else:
+            serp = _tool_payload(result)
+        if "error" in serp:
+            span.set(failed=True)
+            print(f"⚠️ Shared search failed, agents will search on their own: {serp['error'][:200]}")
+            return None
+        blocks = [f"### Web search: {user_query}\n{serp['result']}"]
+        urls = search_result_urls(serp["result"], pre_scrape) if pre_scrape > 0 else []
+        if urls:
+            pages = await asyncio.gather(
+                *(session.call_tool(SCRAPE_TOOL, {"url": url}) for url in urls), return_exceptions=True,
+            )
+            for url, page in zip(urls, pages):
+                if isinstance(page, BaseException) or getattr(page, "isError", False):
+                    continue
+                text = _tool_payload(page)["result"]
+                if len(text) > GROUNDING_PAGE_CHARS:
+                    text = text[:GROUNDING_PAGE_CHARS] + "\n[… page truncated]"
+                blocks.append(f"### Page: {url}\n{text}")
+        span.set(pages=len(blocks) - 1, context_chars=sum(len(block) for block in blocks))
+        return "\n\n".join(blocks)
+
+def _history_part(part):
+    """A model part as it goes back into the conversation (SDK parts keep their thought signatures)."""
+    if isinstance(part, genai.types.Part):
+        return part
+    if getattr(part, 'function_call', None) is not None:
+        call = part.function_call
+        return genai.types.Part(function_call=genai.types.FunctionCall(
+            id=getattr(call, 'id', None), name=call.name, args=getattr(call, 'args', None) or {},
+        ))
+    return genai.types.Part(text=getattr(part, 'text', None) or "")
+
+def _function_response(call, payload):
+    return genai.types.Part(function_response=genai.types.FunctionResponse(
+        id=getattr(call, 'id', None), name=call.name, response=payload,
+    ))
+
+def _tool_payload(result):
+    """Function response body for an MCP CallToolResult."""
+    text = "\n".join(getattr(item, 'text', None) or "" for item in result.content or [])
+    return {"error": text} if getattr(result, 'isError', False) else {"result": text}
+
+async def _run_tool_calls(session, calls, concurrency, numbered_from, emit_json, on_event, allowed_names=None):
+    """Run one turn's function calls concurrently (at most concurrency at once), in call order."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_call(number, call):
+        args = dict(getattr(call, 'args', None) or {})
+        emit_json(f"🔨 TOOL CALL #{number}: {call.name}", args)
+        if on_event:
+            on_event({"type": "tool_call", "name": call.name, "args": args})
+        async with semaphore:
+            try:
+                if allowed_names is not None and call.name not in allowed_names:
+                    payload = {"error": f"Tool {call.name} is not available to this agent."}
+                else:
+                    payload = _tool_payload(await session.call_tool(call.name, args))
+            except Exception as error:
+                # The model can work around one failed tool; the agent should not die for it
+                payload = {"error": f"{type(error).__name__}: {error}"}
+        emit_json(f"📥 TOOL RESPONSE #{number}: {call.name}", payload)
+        if on_event:
+            on_event({"type": "tool_response", "name": call.name, "response": payload})
+        return _function_response(call, payload)
+
+    return list(await asyncio.gather(
+        *(run_call(numbered_from + index + 1, call) for index, call in enumerate(calls))
+    ))
+
+def _schema_name(schema):
+    return getattr(schema, "__name__", None) or json.dumps(schema, sort_keys=True)
+
+def _parse_structured(response, schema):
+    parsed = getattr(response, "parsed", None)
+    if isinstance(schema, type):
+        if isinstance(parsed, schema):
+            return parsed
+        return schema.model_validate_json(response.text)
+    return parsed if parsed is not None else json.loads(response.text)
+
+async def _structure_answer(model, section_name, answer_text, schema, tracer, router=None, semaphore=None,
+                            retry_policy=DEFAULT_RETRY_POLICY, timeout=None):
+    """Turn an agent's gathered answer into schema records with a second, tool-free call.
+
+    Gemini does not accept a JSON response schema together with function calling,
+    so the tool loop runs first and this call only reformats what it found. Like a
+    model turn it waits for the semaphore and is retried under retry_policy, all
+    within timeout seconds.
+    """
+    prompt = f"""
+Convert the {section_name} findings below into JSON that matches the response schema.
+Only use facts stated in the findings. Leave a field empty when it is not given.
+
+Findings:
+{answer_text}
+"""
+    config = genai.types.GenerateContentConfig(
+        temperature=0,
+        response_mime_type="application/json",
+        response_schema=schema,
+    )
+
+    async def attempt():
+        started = time.monotonic()
+        async with semaphore or contextlib.nullcontext(), gemini_limiter.slot():
+            with tracer.span("structure", section=section_name, model=model, schema=_schema_name(schema)) as span:
+                response = await client.aio.models.generate_content(model=model, contents=prompt, config=config)
+                usage = getattr(response, 'usage_metadata', None)
+                span.set(**usage_attributes(usage))
+                if router:
+                    tokens = usage_attributes(usage)
+                    router.record(section_name, model, time.monotonic() - started,
+                                  tokens.get("prompt_tokens"), tokens.get("output_tokens"))
+                return _parse_structured(response, schema)
+
+    async def with_retries():
+        retry_state = retry_policy.begin()
+        while True:
+            try:
+                return await attempt()
+            except Exception as error:
+                error_kind, wait_time = retry_state.after_failure(error)
+                if wait_time is None:
+                    raise
+                with tracer.span("backoff", seconds=round(wait_time, 2), error_kind=error_kind):
+                    await asyncio.sleep(wait_time)
+
+    return await asyncio.wait_for(with_retries(), timeout)
+
+async def _summarize_offers(section_name, offers, model=DEFAULT_MODEL, router=None, tracer=None,
+                            gemini_semaphore=None, retry_policy=DEFAULT_RETRY_POLICY, timeout=None, **_):
+    """Reconcile directly scraped offers into a PriceComparison with one tool-free call."""
+    findings = json.dumps([offer.model_dump() for offer in offers], ensure_ascii=False, indent=2)
+    try:
+        return await _structure_answer(
+            router.choose(section_name) if router else model, section_name, findings, PriceComparison,
+            tracer or NULL_TRACER, router, gemini_semaphore, retry_policy, timeout,
+        )
+    except Exception:
+        return PriceComparison(offers=offers)
+
+def agent_cache_key(section_name, user_query, system_goal, model=DEFAULT_MODEL, temperature=0,
+                    response_schema=None, router=None):
+    """Result-cache key of one agent run, as run_agent_task looks it up."""
+    if router is not None:
+        model = router.candidates(section_name)[0]
+    key_parts = ["agent", normalize_query(user_query), section_name, system_goal, model, temperature]
+    if response_schema is not None:
+        key_parts.append(_schema_name(response_schema))
+    return make_cache_key(*key_parts)
+
+async def run_agent_task(session, section_name, user_query, system_goal, logger=None,
+                         cache=None, cache_ttl=None, model=DEFAULT_MODEL, temperature=0,
+                         gemini_semaphore=None, on_event=None, tracer=None, retry_policy=DEFAULT_RETRY_POLICY,
+                         timeout=AGENT_TIMEOUT, hedge_policy=None, router=None, response_schema=None,
+                         max_turns=MAX_AGENT_TURNS, max_tool_calls=MAX_TOOL_CALLS,
+                         tool_calls_per_turn=TOOL_CALLS_PER_TURN, allowed_tools=None, grounding=None,
+                         on_cache_hit=None, on_timeout=None):
+    """Run one agent to completion and return its answer text.
+
+    The agent loops over model turns itself: every function call the model asks
+    for in one turn runs concurrently (up to tool_calls_per_turn at once) and the
+    results go back in the next turn. After max_turns turns or max_tool_calls
+    tool calls the model must answer with what it has. The model only sees the
+    tools matching allowed_tools (fnmatch patterns), which defaults to the
+    section's SECTION_TOOLS entry. grounding is search context gathered up front
+    (see gather_grounding) that goes into the prompt so the agent can skip its
+    own first search.
+    With on_event set the answer is streamed: on_event receives {"type": "text"},
+    {"type": "tool_call"} and {"type": "tool_response"} events as they arrive, and
+    {"type": "reset"} when a retried attempt or a later turn replaces the text so far.
+    With a tracer, the run, every model attempt and every backoff sleep is
+    recorded as a span. After timeout seconds the run is cancelled and returns its
+    partial streamed answer, or an "unavailable" note, instead of raising.
+    With a hedge_policy, slow non-streamed model requests are hedged. With a
+    router, each attempt uses the router's model for the section instead of model,
+    and an overloaded model is swapped for the section's fallback.
+    With a response_schema (a Pydantic model or a JSON schema dict) the answer is
+    returned as a schema instance (or dict) instead of text; if the answer cannot be
+    structured, or the run timed out, the text is returned as usual.
+    on_cache_hit() is called when the answer comes from the result cache, and
+    on_timeout() when the run was cut off by timeout.
+    """
+    tracer = tracer or NULL_TRACER
+
     def emit(text):
         if logger:
             try:
@@ -38,21 +445,45 @@ async def run_agent_task(session, section_name, user_query, system_goal, logger=
         else:
             print(text)
 
+    # Loggers can set a json_limit attribute to choose how much of each payload they show
+    json_limit = getattr(logger, "json_limit", LOG_JSON_LIMIT)
+
     def emit_json(step_name, data):
         if logger:
             try:
-                snippet = json.dumps(data, indent=2, ensure_ascii=False)
+                if json_limit <= 0:
+                    logger(step_name)
+                    return
+                snippet = format_json_bounded(data, json_limit)
                 logger(f"{step_name}\n```json\n{snippet}\n```")
             except Exception:
-                log_realtime(step_name, data)
+                log_realtime(step_name, data, json_limit)
         else:
-            log_realtime(step_name, data)
+            log_realtime(step_name, data, json_limit)
 
     emit("\n" + "="*80)
     emit(f"🧠 {section_name} — Agent Running")
     emit("="*80)
 
-    task_prompt = f"""
+    if router is not None:
+        # The preferred model stands for the whole tier in the cache key
+        model = router.candidates(section_name)[0]
+
+    with tracer.span("agent", section=section_name, model=model, streamed=bool(on_event)) as agent_span:
+        cache_key = None
+        if cache is not None:
+            cache_key = agent_cache_key(section_name, user_query, system_goal, model, temperature, response_schema)
+            cached_text = cache.get(cache_key)
+            if cached_text is not None:
+                emit(f"⚡ {section_name} — served from cache")
+                agent_span.set(cache_hit=True)
+                if on_cache_hit:
+                    on_cache_hit()
+                if isinstance(response_schema, type) and isinstance(cached_text, dict):
+                    return response_schema.model_validate(cached_text)
+                return cached_text
+
+        task_prompt = f"""
 You are the {section_name} agent.
 Goal: {system_goal}
 
@@ -64,65 +495,447 @@ Instructions:
 - Return clear, factual information. If uncertain, say so.
 - Include sources (URLs) in your answer when possible.
 """
+        if grounding:
+            task_prompt += f"""
+Search results already gathered for this query are below. Start from them instead
+of repeating the search; call tools only for what they do not cover.
 
-    # Robust request with retries to handle transient 5xx (e.g., 503 overloaded)
-    response = None
-    max_attempts = 4
-    base_delay_sec = 1.2
-    for attempt_num in range(1, max_attempts + 1):
-        try:
-            emit(f"Attempt {attempt_num}/{max_attempts}: contacting Gemini…")
-            response = await client.aio.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=task_prompt,
-                config=genai.types.GenerateContentConfig(
-                    temperature=0,
-                    tools=[session],
+{grounding}
+"""
+
+        if allowed_tools is None:
+            allowed_tools = SECTION_TOOLS.get(section_name)
+        contents = [genai.types.Content(role="user", parts=[genai.types.Part(text=task_prompt)])]
+
+        # Robust request with retries: transient 5xx (e.g., 503 overloaded) and 429s are
+        # retried with jittered backoff, auth and other 4xx errors fail straight away
+        stream_parts = []
+        # One retry state for the whole run, so the policy's deadline and attempt
+        # budget cover every turn together
+        retry_state = retry_policy.begin()
+
+        async def model_turn(turn, turn_config):
+            """One model request (with retries); returns (parts, text) of its answer."""
+            max_attempts = retry_policy.max_attempts
+            for attempt_num in range(1, max_attempts + 1):
+                attempt_model = router.choose(section_name) if router else model
+                attempt_started = time.monotonic()
+                try:
+                    emit(f"Turn {turn}, attempt {attempt_num}/{max_attempts}: contacting Gemini ({attempt_model})…")
+                    if on_event and stream_parts:
+                        # A retried or follow-up turn rewrites the answer from scratch
+                        stream_parts.clear()
+                        on_event({"type": "reset"})
+                    async with gemini_semaphore or contextlib.nullcontext(), gemini_limiter.slot():
+                        with tracer.span("model_attempt", turn=turn, attempt=attempt_num, model=attempt_model) as attempt_span:
+                            if on_event:
+                                call_parts = []
+                                usage = await _stream_response(
+                                    attempt_model, contents, turn_config, on_event, stream_parts, call_parts,
+                                )
+                                response_text = "".join(stream_parts)
+                                parts = ([genai.types.Part(text=response_text)] if response_text else []) + call_parts
+                            else:
+                                if hedge_policy:
+                                    async def generate(model_name, is_hedge):
+                                        # The hedge is an extra request, so it needs its own limiter slot
+                                        async with gemini_limiter.slot() if is_hedge else contextlib.nullcontext():
+                                            return await client.aio.models.generate_content(
+                                                model=model_name,
+                                                contents=contents,
+                                                config=turn_config,
+                                            )
+                                    response, answered_by, hedged = await hedge_policy.run(generate, attempt_model, key=section_name)
+                                    if hedged:
+                                        emit(f"🪂 Slow Gemini response hedged; answer came from {answered_by}")
+                                    attempt_span.set(hedged=hedged, answered_by=answered_by)
+                                else:
+                                    response = await client.aio.models.generate_content(
+                                        model=attempt_model,
+                                        contents=contents,
+                                        config=turn_config,
+                                    )
+                                parts = [part for i, _, part in _iter_parts(response) if i == 0]
+                                response_text = "".join(getattr(part, 'text', None) or "" for part in parts)
+                                usage = getattr(response, 'usage_metadata', None)
+                            attempt_span.set(response_chars=len(response_text or ""), **usage_attributes(usage))
+                            if router:
+                                tokens = usage_attributes(usage)
+                                cost = router.record(
+                                    section_name, attempt_model, time.monotonic() - attempt_started,
+                                    tokens.get("prompt_tokens"), tokens.get("output_tokens"),
+                                )
+                                attempt_span.set(cost_usd=cost)
+                    return parts, response_text
+                except Exception as request_error:
+                    error_kind, wait_time = retry_state.after_failure(request_error)
+                    if router:
+                        router.record(section_name, attempt_model, time.monotonic() - attempt_started, ok=False)
+                        if is_overload_error(request_error):
+                            router.report_overload(attempt_model)
+                            if wait_time is not None and router.choose(section_name) != attempt_model:
+                                # A different model is free: no need to wait out this one's overload
+                                wait_time = min(wait_time, 0.5)
+                    if wait_time is None:
+                        emit(f"❌ Model request failed: {request_error}. Not retrying ({error_kind}); aborting this agent.")
+                        raise
+                    emit(f"⚠️ Model request failed ({error_kind}): {request_error}. Retrying in {wait_time:.1f}s…")
+                    with tracer.span("backoff", attempt=attempt_num, seconds=round(wait_time, 2), error_kind=error_kind):
+                        await asyncio.sleep(wait_time)
+
+        tool_calls_made = 0
+
+        async def agent_loop():
+            nonlocal tool_calls_made
+            # Listing the tools can wait on a cold MCP pool, so it counts against the timeout too
+            try:
+                declarations = await tool_catalogue.declarations(session, allowed_tools)
+            except Exception as error:
+                emit(f"❌ Could not list the MCP tools: {error}")
+                agent_span.set(tools_error=f"{type(error).__name__}: {error}")
+                return None
+            agent_span.set(tools=len(declarations))
+            config = genai.types.GenerateContentConfig(
+                temperature=temperature,
+                tools=[genai.types.Tool(function_declarations=declarations)],
+                # We run the tool loop ourselves so one turn's calls can go out in parallel
+                automatic_function_calling=genai.types.AutomaticFunctionCallingConfig(disable=True),
+            )
+            # Once the turn or tool budget is spent, the model gets one last turn to answer with what it has
+            final_config = config.model_copy(update={
+                "tool_config": genai.types.ToolConfig(
+                    function_calling_config=genai.types.FunctionCallingConfig(mode="NONE"),
                 ),
+            })
+            for turn in range(1, max_turns + 1):
+                out_of_budget = turn == max_turns or tool_calls_made >= max_tool_calls
+                parts, response_text = await model_turn(turn, final_config if out_of_budget else config)
+                calls = [part.function_call for part in parts if getattr(part, 'function_call', None) is not None]
+                if not calls or out_of_budget:
+                    agent_span.set(turns=turn, tool_calls=tool_calls_made)
+                    return response_text
+                contents.append(genai.types.Content(role="model", parts=[_history_part(part) for part in parts]))
+                allowed = calls[: max_tool_calls - tool_calls_made]
+                if len(allowed) < len(calls):
+                    emit(f"🧮 Tool budget reached: running {len(allowed)} of {len(calls)} requested calls")
+                responses = await _run_tool_calls(
+                    session, allowed, tool_calls_per_turn, tool_calls_made, emit_json, on_event,
+                    {declaration.name for declaration in declarations},
+                )
+                tool_calls_made += len(allowed)
+                responses += [
+                    _function_response(call, {"error": "Tool budget for this agent is used up; answer with what you have."})
+                    for call in calls[len(allowed):]
+                ]
+                contents.append(genai.types.Content(role="user", parts=responses))
+
+        started = time.monotonic()
+        try:
+            response_text = await asyncio.wait_for(agent_loop(), timeout)
+        except asyncio.TimeoutError:
+            if timeout is None or time.monotonic() - started < timeout:
+                raise  # a timeout from inside the attempts, not our deadline
+            partial_text = "".join(stream_parts)
+            emit(f"⏱️ {section_name} — no complete answer within {timeout:.0f}s; returning what is available.")
+            agent_span.set(timed_out=True, partial_chars=len(partial_text), tool_calls=tool_calls_made)
+            if on_timeout:
+                on_timeout()
+            if partial_text:
+                return partial_text + f"\n\n_⏱️ Cut off after {timeout:.0f}s — this section may be incomplete._"
+            return f"⏱️ {section_name} is unavailable: the agent did not answer within {timeout:.0f}s."
+        if response_text is None:
+            return f"⚠️ {section_name} is unavailable: the tool server could not be reached."
+
+        emit("\n" + "="*80)
+        emit(f"✅ {section_name} — Agent Completed ({tool_calls_made} tool calls)")
+        emit("="*80)
+        emit(response_text)
+        emit("="*80)
+
+        result = response_text
+        if response_schema is not None and response_text:
+            structure_model = router.choose(section_name) if router else model
+            # Structuring is part of the agent's time budget, not extra time on top of it
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            try:
+                result = await _structure_answer(
+                    structure_model, section_name, response_text, response_schema, tracer, router,
+                    gemini_semaphore, retry_policy, remaining,
+                )
+                emit(f"🧾 {section_name} — structured into {_schema_name(response_schema)}")
+            except Exception as structure_error:
+                reason = str(structure_error) or type(structure_error).__name__
+                emit(f"⚠️ Could not structure the {section_name} answer ({reason}); returning text.")
+                return response_text
+
+        if cache_key is not None and response_text:
+            cache.set(cache_key, to_jsonable(result), cache_ttl or SECTION_TTLS.get(section_name, DEFAULT_TTL))
+
+        return result
+
+async def stream_agent_task(session, section_name, user_query, system_goal, **kwargs):
+    """Async iterator over a streamed agent run.
+
+    Yields the run_agent_task events as they happen, then {"type": "done", "text": ...}
+    with the final answer. A failed run re-raises its error from the iterator.
+    """
+    events = asyncio.Queue()
+    task = asyncio.ensure_future(
+        run_agent_task(session, section_name, user_query, system_goal, on_event=events.put_nowait, **kwargs)
+    )
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+        yield {"type": "done", "text": task.result()}
+    finally:
+        task.cancel()
+
+
+async def run_agents(session, user_query, agents, concurrent=True, loggers=None, on_done=None, on_text=None,
+                     timeouts=None, response_schemas=None, price_history=None, price_max_age=PRICE_MAX_AGE,
+                     shared_search=False, pre_scrape=0, price_fast_path=False, on_timeout=None, **task_kwargs):
+    """Run (key, section_name, goal) agents over one MCP session and return {key: text}.
+
+    In concurrent mode every agent starts at once, so the report takes about as
+    long as the slowest agent instead of the sum of all of them. on_done(key, text)
+    is called as soon as each agent finishes. With on_text(key, text_so_far) set the
+    agents stream and report their partial answers while they work. timeouts maps
+    agent keys to their own deadline in seconds, and response_schemas maps agent
+    keys to a schema whose records replace that agent's text. With a price_history,
+    agents returning a PriceComparison only scrape the retailers without a stored
+    price newer than price_max_age, reuse the rest and record what they found.
+    With shared_search, one web search (plus pre_scrape scraped result pages) runs
+    before the agents and is given to all of them as grounding, instead of every
+    agent opening with the same search. With price_fast_path, PriceComparison
+    agents first scrape the known retailers' product pages directly and parse
+    them without the model; the agent only covers the retailers that failed, and
+    when none did a single tool-free call summarizes the offers. on_timeout(key) is
+    called for each agent cut off by its time budget. Any other keyword arguments
+    are passed through to run_agent_task.
+    """
+    loggers = loggers or {}
+    timeouts = timeouts or {}
+    response_schemas = response_schemas or {}
+
+    def cache_key(key, section_name, goal):
+        return agent_cache_key(
+            section_name, user_query, goal, task_kwargs.get("model", DEFAULT_MODEL), task_kwargs.get("temperature", 0),
+            response_schemas.get(key), task_kwargs.get("router"),
+        )
+
+    cache = task_kwargs.get("cache")
+    # A run served entirely from the result cache makes no MCP calls, so search only if an agent will run
+    if (shared_search and agents and task_kwargs.get("grounding") is None
+            and (cache is None or any(cache.get(cache_key(*agent)) is None for agent in agents))):
+        task_kwargs["grounding"] = await gather_grounding(
+            session, user_query, pre_scrape=pre_scrape, tracer=task_kwargs.get("tracer"),
+        )
+
+    async def fast_prices(key, section_name, goal, stale, agent_kwargs, on_cache_hit):
+        """Scrape the stale retailers directly within the agent's time budget.
+
+        Returns (comparison, offers, retailers left for the agent); comparison is
+        None unless every retailer was read (or the section was cached), and
+        agent_kwargs["timeout"] is cut to what the agent has left. A timeout of
+        None means no budget, as in run_agent_task.
+        """
+        log = loggers.get(key) or print
+        fast_key = cache_key(key, section_name, goal) if cache is not None else None
+        cached = cache.get(fast_key) if fast_key else None
+        if cached is not None:
+            log(f"⚡ {section_name} — served from cache")
+            on_cache_hit()
+            return (PriceComparison.model_validate(cached) if isinstance(cached, dict) else cached), [], []
+        budget = agent_kwargs.get("timeout", AGENT_TIMEOUT)
+        started = time.monotonic()
+        direct = []
+        try:
+            direct, stale = await asyncio.wait_for(
+                direct_price_offers(session, user_query, stale, tracer=task_kwargs.get("tracer")), budget,
             )
-            break
-        except Exception as request_error:
-            wait_time = base_delay_sec * (2 ** (attempt_num - 1))
-            emit(f"⚠️ Model request failed: {request_error}. Retrying in {wait_time:.1f}s…")
-            if attempt_num == max_attempts:
-                emit("❌ Max retries reached. Aborting this agent.")
-                raise
-            await asyncio.sleep(wait_time)
-
-    emit("\n📊 REAL-TIME TOOL EXECUTION (" + section_name + "):")
-    emit("="*80)
+            log(f"⚡ Direct scrape: {len(direct)} offer(s)" + (f", agent covers {', '.join(stale)}" if stale else ""))
+        except asyncio.TimeoutError:  # only with a budget; wait_for(..., None) never times out
+            log(f"⏱️ Direct scrape timed out after {budget:.0f}s")
+        if budget is not None:
+            agent_kwargs["timeout"] = max(budget - (time.monotonic() - started), 0)
+        if not direct or stale:
+            return None, direct, stale
+        text = await _summarize_offers(section_name, direct, **{**task_kwargs, "timeout": agent_kwargs["timeout"]})
+        if fast_key:
+            cache.set(fast_key, to_jsonable(text),
+                      agent_kwargs.get("cache_ttl") or SECTION_TTLS.get(section_name, DEFAULT_TTL))
+        return text, direct, []
 
-    # Show structure
-    emit(f"🔍 Has candidates: {hasattr(response, 'candidates')}")
-    if hasattr(response, 'candidates') and response.candidates:
-        for i, candidate in enumerate(response.candidates):
-            if hasattr(candidate, 'content') and candidate.content:
-                for j, part in enumerate(candidate.content.parts):
-                    if hasattr(part, 'function_call') and part.function_call is not None:
-                        function_name = getattr(part.function_call, 'name', 'unknown_function')
-                        function_args = getattr(part.function_call, 'args', {})
-                        emit_json(f"🔨 TOOL CALL #{i+1}-{j+1}: {function_name}", function_args)
-                    if hasattr(part, 'function_response') and part.function_response is not None:
-                        response_name = getattr(part.function_response, 'name', 'unknown_response')
-                        response_data = getattr(part.function_response, 'response', {})
-                        emit_json(f"📥 TOOL RESPONSE #{i+1}-{j+1}: {response_name}", response_data)
-                    if hasattr(part, 'text') and part.text:
-                        emit_json(f"💬 AGENT RESPONSE #{i+1}-{j+1}", {"text": part.text[:500] + "..." if len(part.text) > 500 else part.text})
+    async def run_one(key, section_name, goal):
+        agent_kwargs = dict(task_kwargs)
+        if key in timeouts:
+            agent_kwargs["timeout"] = timeouts[key]
+        if key in response_schemas:
+            agent_kwargs["response_schema"] = response_schemas[key]
+        if on_timeout:
+            agent_kwargs["on_timeout"] = lambda: on_timeout(key)
+        is_price = agent_kwargs.get("response_schema") is PriceComparison
+        track_prices = price_history is not None and is_price
+        fresh, direct = [], []
+        stale = PRICE_RETAILERS
+        if track_prices:
+            stale, fresh = price_history.plan_refresh(user_query, max_age=price_max_age)
+            if not stale:
+                text = PriceComparison(
+                    offers=fresh, summary=f"Stored prices from the last {price_max_age / 60:.0f} minutes.",
+                )
+                if on_done:
+                    on_done(key, text)
+                return key, text
+        # Cached answers were recorded when they were scraped; recording them again would
+        # log old prices as new observations and keep them looking fresh
+        from_cache = []
 
-    emit("\n" + "="*80)
-    emit(f"✅ {section_name} — Agent Completed")
-    emit("="*80)
-    emit(response.text)
-    emit("="*80)
+        def note_cache_hit():
+            from_cache.append(True)
+
+        if track_prices:
+            agent_kwargs["on_cache_hit"] = note_cache_hit
+        text = None
+        if price_fast_path and is_price:
+            text, direct, stale = await fast_prices(key, section_name, goal, stale, agent_kwargs, note_cache_hit)
+        if text is None:
+            goal = narrow_price_goal(goal, stale, [*fresh, *direct])
+            if on_text is None:
+                text = await run_agent_task(
+                    session, section_name, user_query, goal, logger=loggers.get(key), **agent_kwargs
+                )
+            else:
+                partial = []
+                async for event in stream_agent_task(
+                    session, section_name, user_query, goal, logger=loggers.get(key), **agent_kwargs
+                ):
+                    if event["type"] == "reset":
+                        partial.clear()
+                        on_text(key, "")
+                    elif event["type"] == "text":
+                        partial.append(event["text"])
+                        on_text(key, "".join(partial))
+                    elif event["type"] == "done":
+                        text = event["text"]
+        text = merge_offers(text, direct)
+        if track_prices:
+            # Offers scraped directly this run are still new next to a cached agent answer
+            observed = PriceComparison(offers=direct) if from_cache else text
+            for change in price_history.record(user_query, observed):
+                (loggers.get(key) or print)(
+                    f"💱 {change['retailer']}: {change['old_price']} → {change['new_price']} ({change['new_stock']})"
+                )
+            text = merge_offers(text, fresh)
+        if on_done:
+            on_done(key, text)
+        return key, text
 
-    return response.text
+    if not concurrent:
+        results = {}
+        for agent in agents:
+            key, text = await run_one(*agent)
+            results[key] = text
+        return results
+
+    tasks = [asyncio.ensure_future(run_one(*agent)) for agent in agents]
+    try:
+        return dict(await asyncio.gather(*tasks))
+    except BaseException:
+        # One agent failed: don't leave the others running on a session that is about to close
+        for task in tasks:
+            task.cancel()
+        raise
+
+def stale_sections(previous, user_query, agents, freshness=None, now=None):
+    """Keys of the agents whose section in a previous report is missing or older than its freshness.
+
+    freshness maps agent keys to seconds; sections without an entry use their
+    SECTION_TTLS lifetime. A report for a different query is stale throughout.
+    """
+    freshness = freshness or {}
+    now = time.time() if now is None else now
+    if not previous or normalize_query(previous.get("query", "")) != normalize_query(user_query):
+        return [key for key, _, _ in agents]
+    stale = []
+    for key, section_name, _ in agents:
+        section = previous.get("sections", {}).get(key)
+        max_age = freshness.get(key, SECTION_TTLS.get(section_name, DEFAULT_TTL))
+        result = section.get("result") if section else None
+        if not result or section.get("timed_out"):
+            stale.append(key)  # missing, empty or cut off by its time budget
+        elif now - section.get("generated_at", 0) >= max_age:
+            stale.append(key)
+    return stale
+
+async def refresh_report(session, user_query, agents, previous=None, freshness=None, on_done=None,
+                         response_schemas=None, **run_kwargs):
+    """Bring a report up to date by re-running only its stale agents.
+
+    A report is {"query": ..., "sections": {key: {"result": ..., "generated_at": epoch, "timed_out": bool}}}.
+    Fresh sections are kept (and reported through on_done straight away), stale
+    ones are re-run with run_agents and merged in. Pass previous=None for a full run.
+    Results may come back from JSON, so schema sections are re-validated.
+    """
+    response_schemas = response_schemas or {}
+    stale = set(stale_sections(previous, user_query, agents, freshness))
+    sections = {}
+    for key, _, _ in agents:
+        if key in stale:
+            continue
+        section = dict(previous["sections"][key])
+        schema = response_schemas.get(key)
+        if isinstance(schema, type) and isinstance(section["result"], dict):
+            section["result"] = schema.model_validate(section["result"])
+        sections[key] = section
+        if on_done:
+            on_done(key, section["result"])
+
+    if stale:
+        timed_out = set()
+        results = await run_agents(
+            session, user_query, [agent for agent in agents if agent[0] in stale], on_done=on_done,
+            response_schemas=response_schemas, on_timeout=timed_out.add, **run_kwargs
+        )
+        generated_at = time.time()
+        for key, result in results.items():
+            sections[key] = {"result": result, "generated_at": generated_at, "timed_out": key in timed_out}
+    return {
+        "query": user_query,
+        "sections": {key: sections[key] for key, _, _ in agents},
+        "refreshed": sorted(stale),
+    }
+
+def build_tool_session(session, tracer=None, tool_cache=None, use_cache=True, semaphore=None,
+                       tool_timeout=TOOL_CALL_TIMEOUT, compact=True):
+    """Wrap an MCP session with the tool-call layers the agents run on.
+
+    From the inside out: per-call timeout, optional concurrency cap, tracing,
+    compaction of scraped pages and the tool-result cache (so cache hits skip all
+    the others and the cache holds compacted results).
+    """
+    if tool_timeout:
+        session = TimeoutSession(session, tool_timeout)
+    if semaphore is not None:
+        session = LimitedSession(session, semaphore)
+    if tracer is not None:
+        session = TracingSession(session, tracer)
+    if compact:
+        session = CompactingSession(session, tracer=tracer)
+    if use_cache:
+        session = CachingSession(session, store=tool_cache)
+    return session
 
 def print_section(title):
     print("\n" + "#"*80)
     print(f"🔷 {title}")
     print("#"*80)
 
-async def run():
+async def run(concurrent=True, trace_path=None, report_path=None):
     print("🚀 Starting Real-Time Agent Workflow...")
     
     async with stdio_client(server_params) as (read, write):
@@ -138,20 +951,31 @@ async def run():
             await session.initialize()
             print("✅ MCP Session Ready - All tools available")
 
-            # Multi-agent workflow
-            product_goal = (
-                "Collect full product profile: official images, title, key specs, variants, dimensions, weight, materials, warranty, box contents. Prefer official sources. Provide clean summary and source links. from indian e commerce sites only."
-            )
-            price_goal = (
-                "Find availability across major Indian e-commerce sites (Amazon, Flipkart, Reliance, Croma, Vijay Sales, official store) and PROVIDE THE BUYING LINK. For each: price, currency, stock status, shipping ETA, seller, warranty notes, URL. Output a concise comparison."
-            )
-            news_goal = (
-                "Summarize recent trending news, memes, launch rumors, controversies, major reviews about the product. Include dates, sources, and brief takeaways."
+            print(f"⚡ Running agents {'concurrently' if concurrent else 'sequentially'}")
+            # Agents often scrape the same pages; share one tool-call cache between them
+            tracer = Tracer(path=trace_path)
+            tool_session = build_tool_session(session, tracer=tracer)
+            previous = None
+            if report_path and os.path.exists(report_path):
+                with open(report_path, encoding="utf-8") as f:
+                    previous = json.load(f)
+            report = await refresh_report(
+                tool_session, user_query, AGENTS, previous=previous, concurrent=concurrent, cache=make_result_cache(),
+                tracer=tracer, router=model_router, response_schemas=SECTION_SCHEMAS, shared_search=True,
+                price_fast_path=True,
             )
-
-            product_text = await run_agent_task(session, "Product Profile", user_query, product_goal)
-            price_text = await run_agent_task(session, "Price & Availability", user_query, price_goal)
-            news_text = await run_agent_task(session, "Trending News & Social Buzz", user_query, news_goal)
+            if report_path:
+                with open(report_path, "w", encoding="utf-8") as f:
+                    json.dump(to_jsonable(report), f, ensure_ascii=False, indent=2)
+                print(f"♻️ Re-ran {report['refreshed'] or 'no sections'}; report saved to {report_path}")
+            results = {key: section["result"] for key, section in report["sections"].items()}
+            print(f"🗄️ Tool cache: {tool_session.hits} hits, {tool_session.misses} misses")
+            compact_rows = [row for row in tracer.summary() if row["span"] == "compact"]
+            if compact_rows:
+                print(f"✂️ Compaction: ~{sum(row['tokens_saved'] for row in compact_rows):,} tokens kept out of the model's context")
+            product_text = results["product"]
+            price_text = to_markdown(results["price"])
+            news_text = results["news"]
 
             # Unified report
             print_section("Unified Shopping Report")
@@ -162,6 +986,19 @@ async def run():
             print_section("3) Trending News & Social Buzz")
             print(news_text)
 
+            print_section("Models")
+            for row in model_router.summary():
+                print(f"{row['section']:<30} {row['model']:<24} x{row['calls']:<3} failures {row['failures']:<2} avg {row['avg_latency_sec']:>6.1f} s  ${row['cost_usd']:.5f}")
+
+            print_section("Timing")
+            for row in tracer.summary():
+                print(f"{row['section']:<30} {row['span']:<14} x{row['count']:<3} avg {row['avg_ms']:>9.1f} ms  max {row['max_ms']:>9.1f} ms  tokens {row['prompt_tokens']}/{row['output_tokens']}")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the multi-agent shopping workflow")
+    parser.add_argument("--sequential", action="store_true", help="Run the agents one after another instead of concurrently")
+    parser.add_argument("--trace", metavar="PATH", help="Append timing spans to this JSONL file")
+    parser.add_argument("--report", metavar="PATH", help="Keep the report in this JSON file and only re-run its stale sections")
+    cli_args = parser.parse_args()
     # Start the asyncio event loop and run the main function
-    asyncio.run(run())
\ No newline at end of file
+    asyncio.run(run(concurrent=not cli_args.sequential, trace_path=cli_args.trace, report_path=cli_args.report))
\ No newline at end of file
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from collections import deque
+
+
+class HedgePolicy:
+    """Hedged Gemini requests to cut tail latency.
+
+    If the primary request has not answered within the chosen percentile of
+    recent latencies (tracked per key, e.g. per section), a second request is
+    sent, optionally to a faster fallback model, and whichever answers first wins
+    while the other is cancelled. Hedges are capped at max_fraction of all
+    requests so a slow period cannot double the traffic.
+    """
+
+    def __init__(self, percentile=95, max_fraction=0.1, fallback_model=None, default_delay=20.0, min_delay=2.0,
+                 min_samples=20, window=200):
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.fallback_model = fallback_model
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, key):
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay, samples[index])
+
+    def _take_budget(self):
+        with self._lock:
+            # +1 lets the very first slow request hedge before there is any traffic history
+            if self.hedges + 1 > self.max_fraction * self.requests + 1:
+                return False
+            self.hedges += 1
+            return True
+
+    async def run(self, make_call, model, key=None):
+        """Await make_call(model, is_hedge), hedging it if it is slow.
+
+        Returns (result, model_that_answered, hedged).
+        """
+        with self._lock:
+            self.requests += 1
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        primary = asyncio.ensure_future(make_call(model, False))
+        primary.add_done_callback(
+            lambda task: task.cancelled() or task.exception() or self.observe(key, loop.time() - started)
+        )
+        tasks = {primary: model}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay(key))
+            if done or not self._take_budget():
+                return await primary, model, False
+
+            hedge_model = self.fallback_model or model
+            tasks[asyncio.ensure_future(make_call(hedge_model, True))] = hedge_model
+            pending = set(tasks)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return task.result(), tasks[task], True
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
@@ -0,0 +1,209 @@
+import asyncio
+import atexit
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+
+from cache import normalize_query
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    """One submitted analysis: its options, live progress and final result.
+
+    Written by the runner thread and read by UI threads, so every update and
+    every snapshot goes through the job's lock.
+    """
+
+    def __init__(self, query, options, log_lines=200):
+        self.id = uuid.uuid4().hex[:12]
+        self.query = query
+        self.options = options
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.result = None
+        self.partial = {}
+        self.sections = {}
+        self.logs = {}
+        self.log_lines = log_lines
+        self._lock = threading.Lock()
+
+    def logger(self, key, json_limit=1500):
+        """A run_agent_task logger that appends to this job's log for agent key."""
+        def log(text):
+            with self._lock:
+                self.logs.setdefault(key, deque(maxlen=self.log_lines)).append(str(text))
+        log.json_limit = json_limit
+        return log
+
+    def set_partial(self, key, text):
+        with self._lock:
+            self.partial[key] = text
+
+    def finish_section(self, key, result):
+        with self._lock:
+            self.sections[key] = result
+            self.partial.pop(key, None)
+
+    def _set(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "query": self.query,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "error": self.error,
+                "result": self.result,
+                "partial": dict(self.partial),
+                "sections": dict(self.sections),
+                "logs": {key: list(lines) for key, lines in self.logs.items()},
+            }
+
+
+class JobStore:
+    """In-memory job table that keeps the newest max_jobs jobs."""
+
+    def __init__(self, max_jobs=200):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest.status not in FINISHED:
+                    break  # never drop a job that is still queued or running
+                del self._jobs[oldest_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, limit=20):
+        with self._lock:
+            return list(reversed(self._jobs.values()))[:limit]
+
+    def latest_result(self, query):
+        """Result of the newest successful job for the same (normalized) query, if any."""
+        normalized = normalize_query(query)
+        with self._lock:
+            jobs = list(reversed(self._jobs.values()))
+        for job in jobs:
+            if job.status == DONE and normalize_query(job.query) == normalized:
+                return job.result
+        return None
+
+
+class JobRunner:
+    """Runs submitted jobs on a private event loop with at most workers at a time.
+
+    handler(job) is an async function that does the work and returns the job's
+    result; it reports progress through the job's logger, set_partial and
+    finish_section. submit() and cancel() are safe to call from any thread, so a
+    UI can queue work and return immediately, then poll the store for progress.
+    """
+
+    def __init__(self, handler, workers=None, store=None):
+        self.handler = handler
+        self.workers = max(1, int(workers or os.environ.get("JOB_WORKERS", "2")))
+        self.store = store or JobStore()
+        self._tasks = {}
+        self._closed = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="job-runner", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._bootstrap(), self._loop).result()
+        atexit.register(self.close)
+
+    async def _bootstrap(self):
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if job.status != QUEUED:
+                continue  # cancelled while waiting
+            job._set(status=RUNNING, started_at=time.time())
+            task = self._tasks[job.id] = asyncio.ensure_future(self.handler(job))
+            try:
+                result = await task
+                job._set(status=DONE, result=result)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise  # the worker itself is shutting down
+                job._set(status=CANCELLED)
+            except Exception as error:
+                traceback.print_exc()
+                job._set(status=FAILED, error=str(error) or type(error).__name__)
+            finally:
+                job._set(finished_at=time.time())
+                self._tasks.pop(job.id, None)
+
+    def submit(self, query, **options):
+        """Queue a job and return it straight away."""
+        if self._closed:
+            raise RuntimeError("JobRunner is closed")
+        job = Job(query, options)
+        self.store.add(job)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job)
+        return job
+
+    def cancel(self, job_id):
+        job = self.store.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+
+        def cancel_on_loop():
+            if job.status == QUEUED:
+                job._set(status=CANCELLED, finished_at=time.time())
+            elif job.id in self._tasks:
+                self._tasks[job.id].cancel()
+
+        self._loop.call_soon_threadsafe(cancel_on_loop)
+        return True
+
+    def stats(self):
+        jobs = self.store.list(limit=self.store.max_jobs)
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, **counts}
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        async def shutdown():
+            tasks = [*self._workers, *self._tasks.values()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=10)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,244 @@
+import asyncio
+import atexit
+import os
+import threading
+
+import anyio
+from mcp import ClientSession
+from mcp.client.stdio import stdio_client
+from mcp.types import CallToolResult, TextContent
+
+# Errors that mean the stdio pipe to the MCP server is gone and the slot must reconnect
+BROKEN_PIPE_ERRORS = (
+    BrokenPipeError,
+    ConnectionError,
+    EOFError,
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+)
+
+
+class SessionProxy(ClientSession):
+    """Stand-in for a ClientSession that forwards the calls the agents make.
+
+    google-genai only turns on MCP tool calling for ClientSession instances, so
+    wrappers subclass it without running ClientSession.__init__.
+    """
+
+    def __init__(self, inner):
+        self._inner = inner
+
+    async def initialize(self):
+        return await self._inner.initialize()
+
+    async def list_tools(self, *args, **kwargs):
+        return await self._inner.list_tools(*args, **kwargs)
+
+    async def call_tool(self, name, arguments=None, *args, **kwargs):
+        return await self._inner.call_tool(name, arguments, *args, **kwargs)
+
+    async def send_ping(self):
+        return await self._inner.send_ping()
+
+
+class LimitedSession(SessionProxy):
+    """Caps how many tool calls are in flight against the MCP server at once."""
+
+    def __init__(self, inner, semaphore):
+        super().__init__(inner)
+        self.semaphore = semaphore
+
+    async def call_tool(self, name, arguments=None, *args, **kwargs):
+        async with self.semaphore:
+            return await super().call_tool(name, arguments, *args, **kwargs)
+
+
+class TimeoutSession(SessionProxy):
+    """Gives every tool call a deadline.
+
+    A call that runs past it is cancelled (through the pool into the MCP session)
+    and comes back to the model as an error result, so one hung scrape costs the
+    agent a tool failure instead of stalling the whole run.
+    """
+
+    def __init__(self, inner, timeout):
+        super().__init__(inner)
+        self.timeout = timeout
+
+    async def call_tool(self, name, arguments=None, *args, **kwargs):
+        try:
+            return await asyncio.wait_for(super().call_tool(name, arguments, *args, **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            return CallToolResult(
+                content=[TextContent(type="text", text=f"Tool {name} timed out after {self.timeout:.0f}s")],
+                isError=True,
+            )
+
+
+class _Slot:
+    def __init__(self, index):
+        self.index = index
+        self.session = None
+        self.init_result = None
+        self.restart = None
+        self.in_flight = 0
+        self.connects = 0
+        self.last_error = None
+
+
+class McpSessionPool:
+    """Pool of long-lived MCP sessions shared across Streamlit reruns.
+
+    MCP sessions are bound to the event loop that opened them, while every
+    Streamlit rerun calls asyncio.run on a fresh loop. The pool keeps its sessions
+    on a private loop in a daemon thread and forwards calls to it, so the npx
+    start-up and MCP handshake happen once per server process instead of once per
+    query. Broken slots are found by a periodic ping and reconnected in place.
+    """
+
+    def __init__(self, server_params, size=None, health_check_interval=30.0, connect_timeout=60.0):
+        self.server_params = server_params
+        self.size = max(1, int(size or os.environ.get("MCP_POOL_SIZE", "2")))
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self._closed = False
+        self._slots = [_Slot(i) for i in range(self.size)]
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="mcp-pool", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._bootstrap(), self._loop).result()
+        atexit.register(self.close)
+
+    def session(self):
+        """Return a ClientSession-compatible handle usable from any event loop."""
+        return SessionProxy(self)
+
+    async def _bootstrap(self):
+        self._changed = asyncio.Condition()
+        self._tasks = [asyncio.ensure_future(self._run_slot(slot)) for slot in self._slots]
+        self._tasks.append(asyncio.ensure_future(self._health_check_loop()))
+
+    async def _run_slot(self, slot):
+        backoff = 1.0
+        while not self._closed:
+            slot.restart = asyncio.Event()
+            try:
+                async with stdio_client(self.server_params) as (read, write):
+                    async with ClientSession(read, write) as session:
+                        slot.init_result = await session.initialize()
+                        slot.session = session
+                        slot.connects += 1
+                        backoff = 1.0
+                        await self._notify()
+                        await slot.restart.wait()
+            except Exception as error:
+                slot.last_error = error
+            finally:
+                slot.session = None
+                await self._notify()
+            if not self._closed:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _health_check_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+            for slot in self._slots:
+                session = slot.session
+                if session is None:
+                    continue
+                try:
+                    await asyncio.wait_for(session.send_ping(), timeout=10.0)
+                except Exception as error:
+                    self._restart(slot, error)
+
+    def _restart(self, slot, error=None):
+        slot.last_error = error
+        slot.session = None
+        if slot.restart is not None:
+            slot.restart.set()
+
+    async def _pick_slot(self):
+        async def wait_ready():
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: self._closed or any(slot.session is not None for slot in self._slots)
+                )
+        try:
+            await asyncio.wait_for(wait_ready(), timeout=self.connect_timeout)
+        except asyncio.TimeoutError:
+            errors = [str(slot.last_error) for slot in self._slots if slot.last_error]
+            raise RuntimeError(f"No MCP session available after {self.connect_timeout:.0f}s: {'; '.join(errors) or 'still connecting'}")
+        if self._closed:
+            raise RuntimeError("MCP session pool is closed")
+        ready = [slot for slot in self._slots if slot.session is not None]
+        return min(ready, key=lambda slot: slot.in_flight)
+
+    async def _call(self, method, *args, **kwargs):
+        # One retry on a fresh slot if the pipe broke under us
+        for attempt in range(2):
+            slot = await self._pick_slot()
+            session = slot.session
+            slot.in_flight += 1
+            try:
+                return await getattr(session, method)(*args, **kwargs)
+            except BROKEN_PIPE_ERRORS as error:
+                self._restart(slot, error)
+                if attempt == 1:
+                    raise
+            finally:
+                slot.in_flight -= 1
+
+    async def _forward(self, coro):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    async def initialize(self):
+        slot = await self._forward(self._pick_slot())
+        return slot.init_result
+
+    async def list_tools(self, *args, **kwargs):
+        return await self._forward(self._call("list_tools", *args, **kwargs))
+
+    async def call_tool(self, name, arguments=None, *args, **kwargs):
+        return await self._forward(self._call("call_tool", name, arguments, *args, **kwargs))
+
+    async def send_ping(self):
+        return await self._forward(self._call("send_ping"))
+
+    def stats(self):
+        return [
+            {
+                "slot": slot.index,
+                "connected": slot.session is not None,
+                "in_flight": slot.in_flight,
+                "connects": slot.connects,
+                "last_error": str(slot.last_error) if slot.last_error else None,
+            }
+            for slot in self._slots
+        ]
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        async def shutdown():
+            for slot in self._slots:
+                self._restart(slot)
+            await self._notify()
+            # Slots close their stdio clients themselves; anything still sleeping gets cancelled
+            _, pending = await asyncio.wait(self._tasks, timeout=5)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=10)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
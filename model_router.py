@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import deque
+
+# USD per million (input, output) tokens, for comparing sections and models
+MODEL_PRICES = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+# Preferred model first, then the fallbacks used while it is overloaded. News is a
+# summary job, so it gets the light model; Price extraction needs the stronger one.
+SECTION_MODELS = {
+    "Product Profile": ["gemini-2.0-flash", "gemini-2.0-flash-lite"],
+    "Price & Availability": ["gemini-2.5-flash", "gemini-2.0-flash"],
+    "Trending News & Social Buzz": ["gemini-2.0-flash-lite", "gemini-2.0-flash"],
+}
+
+
+def estimate_cost(model, prompt_tokens, output_tokens):
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return ((prompt_tokens or 0) * input_price + (output_tokens or 0) * output_price) / 1_000_000
+
+
+class ModelRouter:
+    """Picks a Gemini model per section and falls back to the next one on overload.
+
+    A model that returns 429/503 is skipped for cooldown seconds, so the retry
+    goes to an alternate model instead of waiting on the same one. Every attempt
+    is recorded with its latency, tokens and estimated cost.
+    """
+
+    def __init__(self, section_models=None, default_models=("gemini-2.0-flash",), cooldown=30.0, history=1000):
+        self.section_models = section_models or SECTION_MODELS
+        self.default_models = list(default_models)
+        self.cooldown = cooldown
+        self.records = deque(maxlen=history)
+        self._overloaded_until = {}
+        self._lock = threading.Lock()
+
+    def candidates(self, section):
+        return self.section_models.get(section) or self.default_models
+
+    def choose(self, section):
+        now = time.monotonic()
+        candidates = self.candidates(section)
+        with self._lock:
+            for model in candidates:
+                if self._overloaded_until.get(model, 0) <= now:
+                    return model
+            # Everything is cooling down: use whichever recovers first
+            return min(candidates, key=lambda model: self._overloaded_until.get(model, 0))
+
+    def report_overload(self, model):
+        with self._lock:
+            self._overloaded_until[model] = time.monotonic() + self.cooldown
+
+    def record(self, section, model, latency, prompt_tokens=None, output_tokens=None, ok=True):
+        cost = estimate_cost(model, prompt_tokens, output_tokens)
+        with self._lock:
+            self.records.append({
+                "section": section,
+                "model": model,
+                "latency_sec": round(latency, 3),
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "cost_usd": cost,
+                "ok": ok,
+            })
+        return cost
+
+    def summary(self):
+        """One row per (section, model) with call count, failures, mean latency and total cost."""
+        rows = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            row = rows.setdefault((record["section"], record["model"]), {
+                "section": record["section"],
+                "model": record["model"],
+                "calls": 0,
+                "failures": 0,
+                "total_latency_sec": 0.0,
+                "cost_usd": 0.0,
+            })
+            row["calls"] += 1
+            row["failures"] += not record["ok"]
+            row["total_latency_sec"] += record["latency_sec"]
+            row["cost_usd"] += record["cost_usd"]
+        for row in rows.values():
+            row["avg_latency_sec"] = round(row.pop("total_latency_sec") / row["calls"], 2)
+            row["cost_usd"] = round(row["cost_usd"], 6)
+        return list(rows.values())
@@ -0,0 +1,114 @@
+import os
+import re
+import uuid
+from datetime import datetime
+
+from price_history import PRICE_RETAILERS, retailer_key
+from schemas import PriceComparison
+
+# Canonical name per retailer key, so "Amazon.in" and "Amazon India" share one partition
+_CANONICAL_RETAILERS = {retailer_key(name): name for name in PRICE_RETAILERS}
+
+# Offer columns stored in the files; date and retailer live in the partition directories
+OFFER_FIELDS = ["query", "price", "currency", "stock", "eta", "seller", "url", "finished_at"]
+
+
+def _partition_value(value):
+    return re.sub(r"[^\w.-]+", "_", (value or "").strip()).strip("_") or "unknown"
+
+
+def retailer_partition(name):
+    """Partition value for a retailer as the model spelled it: its canonical name, else its retailer_key."""
+    key = retailer_key(name)
+    return _partition_value(_CANONICAL_RETAILERS.get(key, key))
+
+
+def offer_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("query", pa.string()),
+        ("price", pa.float64()),
+        ("currency", pa.string()),
+        ("stock", pa.string()),
+        ("eta", pa.string()),
+        ("seller", pa.string()),
+        ("url", pa.string()),
+        ("finished_at", pa.timestamp("s")),
+    ])
+
+
+class PriceParquetWriter:
+    """Stream price offers into Parquet files partitioned as date=YYYY-MM-DD/retailer=NAME.
+
+    NAME is the retailer's canonical name (see retailer_partition), so spelling
+    variants from the model do not each open another partition file.
+
+    Offers are buffered until flush_rows are waiting, then written as one Arrow
+    record batch per partition, so memory stays bounded however long the sweep
+    runs. Each partition keeps one open file for the life of the writer; every
+    writer uses its own file name, so reruns add files instead of replacing them.
+    Requires pyarrow.
+
+    Read the result back with pyarrow.dataset.dataset(root, partitioning="hive").
+    """
+
+    def __init__(self, root, flush_rows=500):
+        import pyarrow  # noqa: F401  (fail at start-up, not after the first batch of agents)
+
+        self.root = root
+        self.flush_rows = flush_rows
+        self.rows_written = 0
+        self.schema = offer_schema()
+        self._run_id = datetime.now().strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        self._buffer = {}
+        self._buffered = 0
+        self._writers = {}
+
+    def add(self, query, price, finished_at=None):
+        """Queue the offers of one price result; text results (no offers) are skipped."""
+        if not isinstance(price, PriceComparison):
+            return 0
+        finished_at = finished_at or datetime.now()
+        if isinstance(finished_at, str):
+            finished_at = datetime.fromisoformat(finished_at)
+        finished_at = finished_at.replace(microsecond=0)
+        date = finished_at.date().isoformat()
+        for offer in price.offers:
+            row = {**offer.model_dump(), "query": query, "finished_at": finished_at}
+            partition = (date, retailer_partition(offer.retailer))
+            self._buffer.setdefault(partition, []).append({field: row[field] for field in OFFER_FIELDS})
+        self._buffered += len(price.offers)
+        if self._buffered >= self.flush_rows:
+            self.flush()
+        return len(price.offers)
+
+    def flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for (date, retailer), rows in self._buffer.items():
+            writer = self._writers.get((date, retailer))
+            if writer is None:
+                directory = os.path.join(self.root, f"date={date}", f"retailer={retailer}")
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, f"part-{self._run_id}.parquet")
+                writer = self._writers[(date, retailer)] = pq.ParquetWriter(path, self.schema)
+            writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=self.schema))
+            self.rows_written += len(rows)
+        self._buffer = {}
+        self._buffered = 0
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
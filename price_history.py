@@ -0,0 +1,146 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from cache import SECTION_TTLS, normalize_query
+from schemas import PriceComparison, PriceOffer
+
+# Stores the Price agent is asked to cover; used to tell which of them still need a scrape
+PRICE_RETAILERS = ["Amazon", "Flipkart", "Reliance Digital", "Croma", "Vijay Sales"]
+
+# Stored prices younger than this are reused instead of scraped again
+PRICE_MAX_AGE = SECTION_TTLS["Price & Availability"]
+
+_OFFER_COLUMNS = ["retailer", "price", "currency", "stock", "eta", "seller", "url"]
+
+
+def retailer_key(name):
+    """Comparable retailer name: "Amazon.in" and "Amazon India" both become "amazon"."""
+    match = re.match(r"[a-z0-9]+", (name or "").strip().lower())
+    return match.group(0) if match else ""
+
+
+class PriceHistory:
+    """Append-only SQLite record of every retailer price the Price agent observes.
+
+    Each observation is stored with whether it differs from the previous one for
+    the same product and retailer, so price changes can be listed without
+    diffing the whole table. Indexed for "latest price per retailer" and
+    "history of one product" lookups.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("PRICE_HISTORY_PATH", ".price_history.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS observations ("
+                "id INTEGER PRIMARY KEY, product TEXT NOT NULL, retailer_key TEXT NOT NULL, "
+                "retailer TEXT NOT NULL, price REAL, currency TEXT, stock TEXT, eta TEXT, seller TEXT, url TEXT, "
+                "changed INTEGER NOT NULL, observed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS observations_latest "
+                "ON observations (product, retailer_key, observed_at DESC)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS observations_changes ON observations (product, changed, observed_at)"
+            )
+
+    def _latest_rows(self, product):
+        # Uses observations_latest: one index seek per retailer of the product
+        return self._conn.execute(
+            "SELECT o.retailer_key, " + ", ".join(f"o.{column}" for column in _OFFER_COLUMNS) + ", o.observed_at "
+            "FROM observations o WHERE o.product = ? AND o.observed_at = ("
+            "SELECT MAX(observed_at) FROM observations WHERE product = o.product AND retailer_key = o.retailer_key)",
+            (product,),
+        ).fetchall()
+
+    def record(self, query, comparison, observed_at=None):
+        """Store the offers of one price result and return the retailers whose price or stock changed."""
+        if not isinstance(comparison, PriceComparison) or not comparison.offers:
+            return []
+        product = normalize_query(query)
+        observed_at = observed_at or time.time()
+        changes = []
+        with self._lock, self._conn:
+            previous = {row[0]: row for row in self._latest_rows(product)}
+            for offer in comparison.offers:
+                key = retailer_key(offer.retailer)
+                if not key:
+                    continue
+                before = previous.get(key)
+                changed = before is None or (before[2], before[4]) != (offer.price, offer.stock)
+                if changed:
+                    changes.append({
+                        "retailer": offer.retailer,
+                        "old_price": before[2] if before else None,
+                        "new_price": offer.price,
+                        "old_stock": before[4] if before else None,
+                        "new_stock": offer.stock,
+                    })
+                self._conn.execute(
+                    "INSERT INTO observations (product, retailer_key, " + ", ".join(_OFFER_COLUMNS)
+                    + ", changed, observed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (product, key, *(getattr(offer, column) for column in _OFFER_COLUMNS), int(changed), observed_at),
+                )
+        return changes
+
+    def latest(self, query):
+        """Newest observation per retailer for a product, as dicts with an observed_at timestamp."""
+        with self._lock:
+            rows = self._latest_rows(normalize_query(query))
+        return [dict(zip([*_OFFER_COLUMNS, "observed_at"], row[1:])) for row in rows]
+
+    def history(self, query, retailer=None, since=None, changes_only=False):
+        """Observations of a product, oldest first, optionally for one retailer or only price/stock changes."""
+        sql = "SELECT " + ", ".join(_OFFER_COLUMNS) + ", changed, observed_at FROM observations WHERE product = ?"
+        params = [normalize_query(query)]
+        if retailer:
+            sql += " AND retailer_key = ?"
+            params.append(retailer_key(retailer))
+        if since is not None:
+            sql += " AND observed_at >= ?"
+            params.append(since)
+        if changes_only:
+            sql += " AND changed = 1"
+        sql += " ORDER BY observed_at"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip([*_OFFER_COLUMNS, "changed", "observed_at"], row)) for row in rows]
+
+    def plan_refresh(self, query, retailers=PRICE_RETAILERS, max_age=PRICE_MAX_AGE):
+        """Split retailers into (stale names to scrape, fresh PriceOffers to reuse)."""
+        if not max_age or max_age <= 0:
+            return list(retailers), []
+        cutoff = time.time() - max_age
+        fresh = {}
+        for row in self.latest(query):
+            if row["observed_at"] >= cutoff:
+                fresh[retailer_key(row["retailer"])] = PriceOffer(**{column: row[column] for column in _OFFER_COLUMNS})
+        stale = [name for name in retailers if retailer_key(name) not in fresh]
+        return stale, list(fresh.values())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def narrow_price_goal(goal, stale, fresh):
+    """Tell the Price agent to scrape only the stale retailers."""
+    if not fresh:
+        return goal
+    known = ", ".join(offer.retailer for offer in fresh)
+    return f"{goal} Prices for {known} are already known; only check {', '.join(stale)}."
+
+
+def merge_offers(result, fresh):
+    """Add the reused offers to a fresh price result (new observations win)."""
+    if not isinstance(result, PriceComparison):
+        return result
+    scraped = {retailer_key(offer.retailer) for offer in result.offers}
+    reused = [offer for offer in fresh if retailer_key(offer.retailer) not in scraped]
+    return PriceComparison(offers=[*result.offers, *reused], summary=result.summary)
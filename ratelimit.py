@@ -0,0 +1,124 @@
+import asyncio
+import contextlib
+import threading
+import time
+
+from retry import is_overload_error
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """Token bucket plus AIMD concurrency window shared by every Gemini caller.
+
+    Each success grows the concurrency window by about one request per window
+    (additive increase); a 429 or 503 overload response halves it (multiplicative
+    decrease, at most once per cooldown), and halves the request rate as well when
+    one is configured. The state is guarded by a thread lock and waiters are woken
+    on their own event loop, so one limiter can be shared by Streamlit sessions and
+    batch workers running on different loops.
+    """
+
+    def __init__(self, max_concurrency=8, min_concurrency=1, initial_concurrency=None, rate=None, burst=None,
+                 decrease_factor=0.5, cooldown=1.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(initial_concurrency or max_concurrency)
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.throttles = 0
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._waiters = []
+
+    def _refill(self, now):
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _try_acquire(self):
+        """Take a slot and a token; else return seconds to wait for a token, or None to wait for a slot."""
+        if self.in_flight >= int(self.limit):
+            return None
+        if self.rate:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+            self._tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            future = None
+            with self._lock:
+                wait = self._try_acquire()
+                if wait == 0:
+                    return
+                if wait is None:
+                    future = loop.create_future()
+                    self._waiters.append((loop, future))
+            if future is None:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                await future
+            finally:
+                with self._lock:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+
+    def release(self, throttled=False, succeeded=True):
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttles += 1
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                    if self.rate:
+                        self._refill(now)
+                        self.rate = max(self.max_rate * 0.05, self.rate * self.decrease_factor)
+            elif succeeded:
+                self.limit = min(self.max_concurrency, self.limit + 1 / max(self.limit, 1.0))
+                if self.rate:
+                    self._refill(now)
+                    self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+            waiters, self._waiters = self._waiters, []
+        # Let everyone re-check; the ones that still don't fit re-queue themselves
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.release(succeeded=False)
+            raise
+        except Exception as error:
+            self.release(throttled=is_overload_error(error), succeeded=False)
+            raise
+        else:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "rate_per_sec": round(self.rate, 2) if self.rate else None,
+                "throttles": self.throttles,
+            }
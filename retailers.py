@@ -0,0 +1,163 @@
+import asyncio
+import re
+
+from price_history import retailer_key
+from schemas import PriceOffer
+from telemetry import NULL_TRACER
+
+_URL_RE = re.compile(r"https?://[^\s)\]>\"']+")
+_PRICE_RE = re.compile(r"(?:₹|\bRs\.?|\bINR)\s?([\d,]+(?:\.\d{1,2})?)", re.I)
+# Struck-through list prices sit next to the selling price; never take them for it
+_LIST_PRICE_RE = re.compile(r"m\.?r\.?p|list price|was\b|strike|original price", re.I)
+# Nor the amounts in offer, EMI and delivery-threshold lines
+_OFFER_RE = re.compile(
+    r"\bemi\b|/\s?month|bank|card|% off|\boff\b|save|saving|cashback|coupon|exchange|"
+    r"delivery (?:over|above|on orders)|orders? (?:over|above)",
+    re.I,
+)
+_OUT_OF_STOCK_RE = re.compile(r"out of stock|sold out|currently unavailable|coming soon|notify me", re.I)
+_IN_STOCK_RE = re.compile(r"in stock|add to cart|buy now|only \d+ left", re.I)
+_ETA_RE = re.compile(r"((?:free )?delivery (?:by|on)?\s*[^\n|.]{3,40}|get it by [^\n|.]{3,30})", re.I)
+
+
+def _not_selling_price(line):
+    return bool(_LIST_PRICE_RE.search(line) or _OFFER_RE.search(line))
+
+
+class RetailerExtractor:
+    """How to find and read one retailer's product page.
+
+    search_domain narrows the resolving web search, product_url picks product
+    pages out of its results, and price_label / seller_pattern read the scraped
+    markdown. A page whose price label cannot be found yields no offer, so the
+    retailer is left to the LLM agent rather than guessed.
+    """
+
+    def __init__(self, name, search_domain, product_url, price_label=None, seller_pattern=None):
+        self.name = name
+        self.search_domain = search_domain
+        self.product_url = re.compile(product_url, re.I)
+        self.price_label = re.compile(price_label, re.I) if price_label else None
+        self.seller_pattern = re.compile(seller_pattern, re.I) if seller_pattern else None
+
+    def pick_url(self, serp_text):
+        for url in _URL_RE.findall(serp_text):
+            url = url.rstrip(".,;")
+            if self.product_url.search(url):
+                return url
+        return None
+
+    def extract_price(self, page):
+        """The selling price next to this retailer's price label, or None when it cannot be told apart."""
+        if not self.price_label:
+            return None
+        lines = [line for line in page.splitlines() if line.strip()]
+        for index, line in enumerate(lines):
+            if not self.price_label.search(line) or _not_selling_price(line):
+                continue
+            match = _PRICE_RE.search(line)
+            if match is None and index + 1 < len(lines) and not _not_selling_price(lines[index + 1]):
+                # "Special price" on its own line, with the amount on the next one
+                match = _PRICE_RE.search(lines[index + 1])
+            if match:
+                return float(match.group(1).replace(",", ""))
+        return None
+
+    def extract(self, page, url):
+        """A PriceOffer read from a scraped product page, or None when no price is found."""
+        price = self.extract_price(page)
+        if price is None:
+            return None
+        # Only the top of the page describes this product; further down are recommendations
+        head = page[:4000]
+        if _OUT_OF_STOCK_RE.search(head):
+            stock = "Out of stock"
+        elif _IN_STOCK_RE.search(head):
+            stock = "In stock"
+        else:
+            stock = None
+        # "FREE delivery over ₹499" is a threshold, not a delivery date
+        eta = next(filter(None, (_ETA_RE.search(line) for line in head.splitlines() if not _OFFER_RE.search(line))), None)
+        seller = self.seller_pattern.search(head) if self.seller_pattern else None
+        return PriceOffer(
+            retailer=self.name,
+            price=price,
+            currency="INR",
+            stock=stock,
+            eta=eta.group(1).strip() if eta else None,
+            seller=seller.group(1).strip() if seller else None,
+            url=url,
+        )
+
+
+RETAILERS = {
+    "amazon": RetailerExtractor(
+        "Amazon", "amazon.in", r"amazon\.in/(?:[^/\s]+/)?(?:dp|gp/product)/[A-Z0-9]{10}",
+        price_label=r"deal price|price to pay|^\s*price\b",
+        seller_pattern=r"sold by\s*:?\s*([^\n|.]{2,60})",
+    ),
+    "flipkart": RetailerExtractor(
+        "Flipkart", "flipkart.com", r"flipkart\.com/[^\s]+/p/itm[a-z0-9]+",
+        price_label=r"special price|^\s*₹",
+        seller_pattern=r"seller\s*:?\s*([^\n|]{2,60})",
+    ),
+    "reliance": RetailerExtractor(
+        "Reliance Digital", "reliancedigital.in", r"reliancedigital\.in/(?:product/)?[^\s]+/p/\d+|reliancedigital\.in/product/",
+        price_label=r"offer price|deal price",
+    ),
+    "croma": RetailerExtractor(
+        "Croma", "croma.com", r"croma\.com/[^\s]+/p/\d+",
+        price_label=r"offer price|^\s*₹",
+    ),
+    "vijay": RetailerExtractor(
+        "Vijay Sales", "vijaysales.com", r"vijaysales\.com/(?:p/)?[^\s]+/\d+",
+        price_label=r"offer price|special price|^\s*₹",
+    ),
+}
+
+
+def _result_text(result):
+    return "\n".join(getattr(item, "text", None) or "" for item in getattr(result, "content", None) or [])
+
+
+async def _fetch_offer(session, query, extractor, search_tool, scrape_tool, tracer):
+    with tracer.span("direct_scrape", retailer=extractor.name) as span:
+        serp = await session.call_tool(search_tool, {"query": f"{query} site:{extractor.search_domain}"})
+        if getattr(serp, "isError", False):
+            span.set(outcome="search_failed")
+            return None
+        url = extractor.pick_url(_result_text(serp))
+        if url is None:
+            span.set(outcome="no_product_url")
+            return None
+        page = await session.call_tool(scrape_tool, {"url": url})
+        if getattr(page, "isError", False):
+            span.set(outcome="scrape_failed", url=url)
+            return None
+        offer = extractor.extract(_result_text(page), url)
+        span.set(outcome="ok" if offer else "no_price", url=url)
+        return offer
+
+
+async def direct_price_offers(session, query, retailers, tracer=None, search_tool="search_engine",
+                              scrape_tool="scrape_as_markdown"):
+    """Resolve, scrape and parse each supported retailer's product page concurrently.
+
+    Returns (offers, missing): the offers that were read, and the retailer names
+    that are unsupported or whose page could not be found or parsed, for the
+    LLM agent to cover.
+    """
+    tracer = tracer or NULL_TRACER
+    supported = [(name, RETAILERS[retailer_key(name)]) for name in retailers if retailer_key(name) in RETAILERS]
+    missing = [name for name in retailers if retailer_key(name) not in RETAILERS]
+    results = await asyncio.gather(
+        *(_fetch_offer(session, query, extractor, search_tool, scrape_tool, tracer) for _, extractor in supported),
+        return_exceptions=True,
+    )
+    offers = []
+    for (name, _), result in zip(supported, results):
+        if isinstance(result, PriceOffer):
+            offers.append(result)
+        else:
+            missing.append(name)
+    return offers, missing
@@ -0,0 +1,137 @@
+import asyncio
+import random
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+RETRYABLE = "retryable"
+THROTTLED = "throttled"
+FATAL = "fatal"
+
+# 4xx codes that are worth another try; every other 4xx is the request's own fault
+_RETRYABLE_CLIENT_CODES = {408, 409}
+
+
+def _error_code(error):
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def classify_error(error):
+    """Sort a failed model call into RETRYABLE, THROTTLED or FATAL."""
+    code = _error_code(error)
+    status = str(getattr(error, "status", "") or "")
+    if code == 429 or status == "RESOURCE_EXHAUSTED":
+        return THROTTLED
+    if code is not None:
+        if code >= 500 or code in _RETRYABLE_CLIENT_CODES:
+            return RETRYABLE
+        if 400 <= code < 500:
+            return FATAL  # bad request, auth, permission, unknown model...
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, OSError)):
+        return RETRYABLE
+    if isinstance(error, (TypeError, ValueError, KeyError, AttributeError, NotImplementedError)):
+        return FATAL  # a bug on our side; retrying will not fix it
+    return RETRYABLE
+
+
+def is_overload_error(error):
+    """True for the 429 / 503 responses that mean we are sending too much."""
+    return classify_error(error) == THROTTLED or _error_code(error) == 503
+
+
+def _parse_duration(value):
+    match = re.fullmatch(r"\s*([\d.]+)\s*s?\s*", str(value))
+    return float(match.group(1)) if match else None
+
+
+def retry_after_seconds(error):
+    """Server-requested delay from a google.rpc.RetryInfo detail or a Retry-After header, if any."""
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details).get("details")
+    for detail in details if isinstance(details, list) else []:
+        if isinstance(detail, dict) and str(detail.get("@type", "")).endswith("RetryInfo"):
+            seconds = _parse_duration(detail.get("retryDelay", ""))
+            if seconds is not None:
+                return seconds
+
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    header = headers.get("retry-after") if headers is not None else None
+    if header:
+        seconds = _parse_duration(header)
+        if seconds is not None:
+            return seconds
+        try:
+            return max(0.0, (parsedate_to_datetime(header) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+class RetryPolicy:
+    """Retry rules shared by every agent: error classification, decorrelated jitter,
+    server-provided retry delays and a total deadline per agent run.
+
+    Fatal errors fail at once. Throttled errors wait at least throttle_delay (or
+    what the server asked for). Jitter keeps agents that failed together from
+    retrying in lockstep.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.2, max_delay=30.0, throttle_delay=5.0, deadline=180.0,
+                 classify=classify_error):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttle_delay = throttle_delay
+        self.deadline = deadline
+        self.classify = classify
+
+    def begin(self):
+        return RetryState(self)
+
+
+class RetryState:
+    """Bookkeeping for one agent run under a RetryPolicy."""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.attempts = 0
+        self.started = time.monotonic()
+        self.last_delay = policy.base_delay
+
+    def remaining(self):
+        if self.policy.deadline is None:
+            return None
+        return self.policy.deadline - (time.monotonic() - self.started)
+
+    def after_failure(self, error):
+        """Return (kind, delay_seconds); delay is None when the run should give up, with kind saying why."""
+        self.attempts += 1
+        policy = self.policy
+        kind = policy.classify(error)
+        if kind == FATAL:
+            return kind, None
+        if self.attempts >= policy.max_attempts:
+            return "attempts exhausted", None
+
+        # Decorrelated jitter: grows roughly 3x per retry but is spread across [base, 3 * last]
+        delay = min(policy.max_delay, random.uniform(policy.base_delay, self.last_delay * 3))
+        if kind == THROTTLED:
+            delay = max(delay, policy.throttle_delay)
+        server_delay = retry_after_seconds(error)
+        if server_delay is not None:
+            delay = max(delay, server_delay)
+        self.last_delay = delay
+
+        remaining = self.remaining()
+        if remaining is not None and delay >= remaining:
+            return "deadline exceeded", None
+        return kind, delay
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
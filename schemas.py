@@ -0,0 +1,55 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class PriceOffer(BaseModel):
+    retailer: str = Field(description="Store name, e.g. Amazon, Flipkart, Croma")
+    price: Optional[float] = Field(None, description="Current selling price as a number, without currency symbols")
+    currency: Optional[str] = Field(None, description="ISO currency code, e.g. INR")
+    stock: Optional[str] = Field(None, description="Stock status as shown by the store, e.g. In stock, Out of stock")
+    eta: Optional[str] = Field(None, description="Shipping or delivery estimate")
+    seller: Optional[str] = Field(None, description="Seller of record")
+    url: Optional[str] = Field(None, description="Buying link for this offer")
+
+
+class PriceComparison(BaseModel):
+    offers: List[PriceOffer] = Field(default_factory=list)
+    summary: Optional[str] = Field(None, description="One or two sentences comparing the offers")
+
+    def to_markdown(self):
+        lines = []
+        if self.summary:
+            lines += [self.summary, ""]
+        if not self.offers:
+            return "\n".join(lines) or "No offers found."
+        lines.append("| Retailer | Price | Stock | ETA | Seller | Link |")
+        lines.append("|---|---|---|---|---|---|")
+        for offer in sorted(self.offers, key=lambda offer: (offer.price is None, offer.price or 0)):
+            price = f"{offer.currency or ''} {offer.price:,.2f}".strip() if offer.price is not None else "—"
+            link = f"[Buy]({offer.url})" if offer.url else "—"
+            lines.append(
+                f"| {offer.retailer} | {price} | {offer.stock or '—'} | {offer.eta or '—'} | {offer.seller or '—'} | {link} |"
+            )
+        return "\n".join(lines)
+
+
+# Sections whose answers are returned as typed records instead of markdown
+SECTION_SCHEMAS = {
+    "price": PriceComparison,
+}
+
+
+def to_jsonable(value):
+    """Turn agent results (text or schema instances) into plain JSON values."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    return value
+
+
+def to_markdown(value):
+    if hasattr(value, "to_markdown"):
+        return value.to_markdown()
+    return value
@@ -1,15 +1,22 @@
 import asyncio
 import streamlit as st
 import os
+import time
+from collections import deque
 from dotenv import load_dotenv
 
 # Load .env BEFORE importing modules that read env at import time
 load_dotenv()
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from mcp import StdioServerParameters
 
-from gemini import run_agent_task
+from cache import MemoryCache, make_result_cache, normalize_query
+from gemini import build_tool_session, gemini_hedging, model_router, refresh_report
+from jobs import FAILED, FINISHED, JobRunner
+from mcp_pool import McpSessionPool
+from price_history import PriceHistory
+from schemas import SECTION_SCHEMAS, PriceComparison, to_jsonable
+from telemetry import Tracer
 
 
 st.set_page_config(page_title="Shopping Agent — Multi-Agent", layout="wide")
@@ -19,30 +26,148 @@ with st.sidebar:
     st.header("Search")
     product_query = st.text_input("What product are you looking for?", value="google pixel 8")
     show_logs = st.checkbox("Show live tool logs", value=True)
+    run_concurrently = st.checkbox("Run agents concurrently", value=True)
+    use_cache = st.checkbox("Reuse cached results", value=True)
+    incremental = st.checkbox("Only re-run sections that are out of date", value=True)
+    run_in_background = st.checkbox("Run in the background (survives a page refresh)", value=True)
+    stream_answers = st.checkbox("Stream answers as they are written", value=True)
+    # Only non-streamed requests can be hedged
+    hedge_requests = st.checkbox("Hedge slow Gemini requests", value=False, disabled=stream_answers)
+    shared_search = st.checkbox("Share one web search between the agents", value=True)
+    pre_scrape = st.number_input("Pre-scrape top search results", min_value=0, max_value=5, value=0,
+                                 disabled=not shared_search)
+    price_table = st.checkbox("Show prices as a table", value=True)
+    price_fast_path = st.checkbox("Scrape known retailers directly", value=True, disabled=not price_table)
+    reuse_prices_min = st.number_input(
+        "Reuse stored retailer prices newer than (minutes, 0 = always re-scrape)", min_value=0, max_value=1440, value=15,
+    )
+    agent_timeout = st.number_input("Time budget per agent (seconds)", min_value=10, max_value=600, value=150, step=10)
     run_button = st.button("Run Analysis")
 
 
-def render_section(title: str, content: str):
+SECTION_TITLES = {
+    "product": "1) Product Overview",
+    "price": "2) Price Comparison & Availability",
+    "news": "3) Trending News & Social Buzz",
+}
+
+
+def _render_content(content):
+    if isinstance(content, PriceComparison):
+        if content.summary:
+            st.markdown(content.summary)
+        if content.offers:
+            # Column headers sort the table when clicked
+            st.dataframe(
+                [offer.model_dump() for offer in content.offers],
+                use_container_width=True,
+                hide_index=True,
+                column_config={"url": st.column_config.LinkColumn("url")},
+            )
+        else:
+            st.markdown("No offers found.")
+    else:
+        st.markdown(content or "No data.")
+
+
+def render_section(title: str, content):
     st.markdown("---")
     st.subheader(title)
-    st.markdown(content or "No data.")
+    _render_content(content)
+
+
+def _section_placeholder(title: str):
+    st.markdown("---")
+    st.subheader(title)
+    body = st.empty()
+    body.markdown("_Waiting for the agent…_")
+    return body
+
+
+class StatusLogger:
+    """Append-only log surface for one st.status box.
 
+    Messages are buffered and rendered as a new chunk at most max_renders_per_sec
+    times a second, so each render only sends the new lines rather than the whole
+    history. Only the newest max_chunks chunks are kept on the page, and oversized
+    messages (large JSON tool payloads) are cut down before they reach the browser.
+    """
 
-def _make_status_logger(status_box):
-    placeholder = st.empty()
-    messages = []
+    def __init__(self, status_box, max_renders_per_sec=4, max_chunks=40, max_message_chars=2000, json_limit=1500):
+        self.status_box = status_box
+        # Read by run_agent_task: tool payloads are never serialized past this many characters
+        self.json_limit = json_limit
+        self.min_interval = 1.0 / max_renders_per_sec
+        self.max_chunks = max_chunks
+        self.max_message_chars = max_message_chars
+        self._pending = []
+        self._chunks = deque()
+        self._last_render = 0.0
+        self._scheduled = None
 
-    def logger(message: str):
-        messages.append(str(message))
-        if len(messages) > 100:
-            del messages[: len(messages) - 100]
-        with status_box:
-            placeholder.markdown("\n\n".join(messages))
+    def _truncate(self, message: str) -> str:
+        if len(message) <= self.max_message_chars:
+            return message
+        hidden = len(message) - self.max_message_chars
+        text = message[: self.max_message_chars]
+        if text.count("```") % 2:
+            text += "\n```"  # close the code fence we cut through
+        return f"{text}\n\n_… {hidden:,} more characters hidden_"
 
-    return logger
+    def __call__(self, message: str):
+        self._pending.append(self._truncate(str(message)))
+        wait = self.min_interval - (time.monotonic() - self._last_render)
+        if wait <= 0:
+            self.flush()
+            return
+        if self._scheduled is None:
+            # Coalesce the rest of this burst into one render when the interval is up
+            try:
+                self._scheduled = asyncio.get_running_loop().call_later(wait, self.flush)
+            except RuntimeError:
+                self.flush()
 
+    def flush(self):
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+        if not self._pending:
+            return
+        chunk = self.status_box.empty()
+        chunk.markdown("\n\n".join(self._pending))
+        self._pending = []
+        self._chunks.append(chunk)
+        if len(self._chunks) > self.max_chunks:
+            self._chunks.popleft().empty()
+        self._last_render = time.monotonic()
 
-async def execute_multi_agent(user_query: str, enable_logs: bool = False):
+
+PRODUCT_GOAL = (
+    "Collect full product profile: official images, title, key specs, variants, dimensions, weight, materials, warranty, box contents. Prefer official sources. Provide clean summary and source links."
+)
+PRICE_GOAL = (
+    "Find availability across major Indian e-commerce sites (Amazon, Flipkart, Reliance, Croma, Vijay Sales, official store). For each: price, currency, stock status, shipping ETA, seller, warranty notes, URL. Output a concise comparison."
+)
+NEWS_GOAL = (
+    "Summarize recent trending news, memes, launch rumors, controversies, major reviews about the product. Include dates, sources, and brief takeaways."
+)
+
+AGENTS = [
+    ("product", "Product Profile", PRODUCT_GOAL),
+    ("price", "Price & Availability", PRICE_GOAL),
+    ("news", "Trending News & Social Buzz", NEWS_GOAL),
+]
+AGENT_LABELS = {
+    "product": "Product agent",
+    "price": "Price & Availability agent",
+    "news": "News & Social Buzz agent",
+}
+
+
+@st.cache_resource
+def get_mcp_pool():
+    # Lives for the whole Streamlit server process, so npx start-up and the MCP
+    # handshake are paid once rather than on every "Run Analysis" click.
     server_params = StdioServerParameters(
         command="npx",
         args=["-y", "@brightdata/mcp"],
@@ -51,78 +176,247 @@ async def execute_multi_agent(user_query: str, enable_logs: bool = False):
             "API_TOKEN": os.environ.get("BRIGHT_DATA_API_TOKEN", ""),
         }
     )
+    return McpSessionPool(server_params)
 
-    product_goal = (
-        "Collect full product profile: official images, title, key specs, variants, dimensions, weight, materials, warranty, box contents. Prefer official sources. Provide clean summary and source links."
-    )
-    price_goal = (
-        "Find availability across major Indian e-commerce sites (Amazon, Flipkart, Reliance, Croma, Vijay Sales, official store). For each: price, currency, stock status, shipping ETA, seller, warranty notes, URL. Output a concise comparison."
+
+@st.cache_resource
+def get_result_cache():
+    # AGENT_CACHE=sqlite keeps answers across server restarts
+    return make_result_cache()
+
+
+@st.cache_resource
+def get_tool_cache():
+    # Shared by every run so repeated scrapes of the same page are served from memory
+    return MemoryCache(max_entries=256)
+
+
+@st.cache_resource
+def get_price_history():
+    # Every price the agent sees is kept on disk (PRICE_HISTORY_PATH) across reruns and restarts
+    return PriceHistory()
+
+
+@st.cache_resource
+def get_job_runner():
+    # One runner per server process: jobs keep going when the page is refreshed
+    # or closed, and any tab can reattach to them through ?job=<id>
+    pool, tool_cache, result_cache, price_history = (
+        get_mcp_pool(), get_tool_cache(), get_result_cache(), get_price_history(),
     )
-    news_goal = (
-        "Summarize recent trending news, memes, launch rumors, controversies, major reviews about the product. Include dates, sources, and brief takeaways."
+
+    async def run_report_job(job):
+        options = job.options
+        session = build_tool_session(
+            pool.session(), tracer=options["tracer"], tool_cache=tool_cache, use_cache=options["use_cache"],
+        )
+        await session.initialize()
+        return await refresh_report(
+            session,
+            job.query,
+            AGENTS,
+            previous=options["previous_report"],
+            concurrent=options["concurrent"],
+            loggers={key: job.logger(key) for key, _, _ in AGENTS},
+            on_done=job.finish_section,
+            on_text=job.set_partial if options["stream"] else None,
+            cache=result_cache if options["use_cache"] else None,
+            tracer=options["tracer"],
+            timeout=options["timeout"],
+            hedge_policy=gemini_hedging if options["hedge"] else None,
+            shared_search=options["shared_search"],
+            pre_scrape=options["pre_scrape"],
+            price_fast_path=options["price_fast_path"],
+            router=model_router,
+            response_schemas=SECTION_SCHEMAS if options["structured"] else None,
+            price_history=price_history,
+            price_max_age=options["reuse_prices_sec"],
+        )
+
+    return JobRunner(run_report_job)
+
+
+async def execute_multi_agent(user_query: str, enable_logs: bool = False, concurrent: bool = True, use_cache: bool = True,
+                              stream: bool = False, tracer: Tracer = None, timeout: float = None, hedge: bool = False,
+                              structured: bool = True, reuse_prices_sec: float = 0, previous_report: dict = None,
+                              shared_search: bool = False, pre_scrape: int = 0, price_fast_path: bool = False):
+    session = build_tool_session(
+        get_mcp_pool().session(), tracer=tracer, tool_cache=get_tool_cache(), use_cache=use_cache,
     )
+    await session.initialize()
+
+    # One status box per agent up front; each one streams its own logs and
+    # flips to complete as soon as its agent finishes.
+    status_boxes = {
+        key: st.status(f"{AGENT_LABELS[key]} running...", expanded=True) for key, _, _ in AGENTS
+    }
+    loggers = {
+        key: StatusLogger(box) for key, box in status_boxes.items()
+    } if enable_logs else {}
+
+    # When streaming, the report sections exist from the start and fill in as the
+    # agents write; partial renders are throttled per section.
+    section_bodies = {
+        key: _section_placeholder(SECTION_TITLES[key]) for key, _, _ in AGENTS
+    } if stream else {}
+    last_render = {}
+
+    def on_text(key: str, text: str):
+        now = time.monotonic()
+        if now - last_render.get(key, 0.0) >= 0.2 or not text:
+            section_bodies[key].markdown(text or "_Retrying…_")
+            last_render[key] = now
+
+    def on_done(key: str, text):
+        if key in loggers:
+            loggers[key].flush()
+        if key in section_bodies:
+            with section_bodies[key].container():
+                _render_content(text)
+        status_boxes[key].update(label=f"{AGENT_LABELS[key]} finished", state="complete")
+
+    try:
+        return await refresh_report(
+            session,
+            user_query,
+            AGENTS,
+            previous=previous_report,
+            concurrent=concurrent,
+            loggers=loggers,
+            on_done=on_done,
+            on_text=on_text if stream else None,
+            cache=get_result_cache() if use_cache else None,
+            tracer=tracer,
+            timeout=timeout,
+            hedge_policy=gemini_hedging if hedge else None,
+            shared_search=shared_search,
+            pre_scrape=pre_scrape,
+            price_fast_path=price_fast_path,
+            router=model_router,
+            response_schemas=SECTION_SCHEMAS if structured else None,
+            price_history=get_price_history(),
+            price_max_age=reuse_prices_sec,
+        )
+    finally:
+        for logger in loggers.values():
+            logger.flush()
+
 
-    # We will stream logs inside each st.status block directly
-
-    async with stdio_client(server_params) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-
-            with st.status("Product agent running...", expanded=True) as status_box:
-                product_logger = _make_status_logger(status_box) if enable_logs else None
-                product_text = await run_agent_task(
-                    session,
-                    "Product Profile",
-                    user_query,
-                    product_goal,
-                    logger=product_logger,
-                )
-                status_box.update(label="Product agent finished", state="complete")
-
-            with st.status("Price & Availability agent running...", expanded=True) as status_box:
-                price_logger = _make_status_logger(status_box) if enable_logs else None
-                price_text = await run_agent_task(
-                    session,
-                    "Price & Availability",
-                    user_query,
-                    price_goal,
-                    logger=price_logger,
-                )
-                status_box.update(label="Price agent finished", state="complete")
-
-            with st.status("News & Social Buzz agent running...", expanded=True) as status_box:
-                news_logger = _make_status_logger(status_box) if enable_logs else None
-                news_text = await run_agent_task(
-                    session,
-                    "Trending News & Social Buzz",
-                    user_query,
-                    news_goal,
-                    logger=news_logger,
-                )
-                status_box.update(label="News agent finished", state="complete")
-
-            return {
-                "product": product_text,
-                "price": price_text,
-                "news": news_text,
-            }
-
-
-if run_button and product_query.strip():
+def render_raw_outputs(results, tracer: Tracer, query: str):
+    with st.expander("Raw outputs"):
+        st.json(to_jsonable(results))
+        st.caption("Where the time went")
+        st.dataframe(tracer.summary(), use_container_width=True)
+        st.caption("Models used per section (since server start)")
+        st.dataframe(model_router.summary(), use_container_width=True)
+        st.caption("Price changes seen for this product")
+        st.dataframe(get_price_history().history(query, changes_only=True), use_container_width=True)
+
+
+def render_job(job):
+    """Draw a background job as it stands right now; returns its snapshot."""
+    snapshot = job.snapshot()
+    started = snapshot["started_at"] or snapshot["created_at"]
+    elapsed = (snapshot["finished_at"] or time.time()) - started
+    st.caption(f"Job `{snapshot['id']}` · {snapshot['query']} · {snapshot['status']} · {elapsed:.0f}s")
+    if snapshot["status"] not in FINISHED and st.button("Cancel job"):
+        get_job_runner().cancel(snapshot["id"])
+    if snapshot["status"] == FAILED:
+        st.error(f"Analysis failed: {snapshot['error']}")
+
+    report = snapshot["result"]
+    if report:
+        sections = {key: section["result"] for key, section in report["sections"].items()}
+        if report.get("refreshed") is not None and job.options["previous_report"] is not None:
+            st.caption(f"Re-ran: {', '.join(report['refreshed']) or 'nothing, every section was still fresh'}")
+    else:
+        sections = snapshot["sections"]
+    for key, title in SECTION_TITLES.items():
+        if key in sections:
+            render_section(title, sections[key])
+        elif snapshot["status"] in FINISHED:
+            render_section(title, None)
+        else:
+            render_section(title, snapshot["partial"].get(key) or "_Waiting for the agent…_")
+
+    if show_logs:
+        for key, lines in snapshot["logs"].items():
+            with st.expander(f"{AGENT_LABELS[key]} log"):
+                st.markdown("\n\n".join(lines[-40:]))
+    return snapshot
+
+
+if run_button and product_query.strip() and run_in_background:
+    runner = get_job_runner()
+    job = runner.submit(
+        product_query.strip(),
+        # AGENT_TRACE_PATH keeps a JSONL record of every run's spans
+        tracer=Tracer(path=os.environ.get("AGENT_TRACE_PATH") or None),
+        # The newest finished job for this query is the report to refresh
+        previous_report=runner.store.latest_result(product_query) if incremental else None,
+        concurrent=run_concurrently,
+        use_cache=use_cache,
+        stream=stream_answers,
+        timeout=agent_timeout,
+        hedge=hedge_requests,
+        shared_search=shared_search,
+        pre_scrape=int(pre_scrape),
+        price_fast_path=price_fast_path,
+        structured=price_table,
+        reuse_prices_sec=reuse_prices_min * 60,
+    )
+    st.query_params["job"] = job.id
+elif run_button and product_query.strip():
+    # AGENT_TRACE_PATH keeps a JSONL record of every run's spans
+    tracer = Tracer(path=os.environ.get("AGENT_TRACE_PATH") or None)
+    # The last report per query lives in the browser session, so a repeat search
+    # only re-runs the sections whose freshness window has passed
+    reports = st.session_state.setdefault("reports", {})
+    report_key = normalize_query(product_query)
+    previous_report = reports.get(report_key) if incremental else None
+    run_args = (product_query.strip(), show_logs, run_concurrently, use_cache, stream_answers, tracer, agent_timeout,
+                hedge_requests, price_table, reuse_prices_min * 60, previous_report, shared_search, int(pre_scrape),
+                price_fast_path)
     with st.spinner("Running multi-agent analysis..."):
         try:
-            results = asyncio.run(execute_multi_agent(product_query.strip(), show_logs))
+            report = asyncio.run(execute_multi_agent(*run_args))
         except RuntimeError:
             # In case an event loop is already running (rare in Streamlit), fall back to create_task
-            results = asyncio.get_event_loop().run_until_complete(
-                execute_multi_agent(product_query.strip(), show_logs)
-            )
+            report = asyncio.get_event_loop().run_until_complete(execute_multi_agent(*run_args))
+    reports[report_key] = report
+    results = {key: section["result"] for key, section in report["sections"].items()}
+    if previous_report is not None:
+        st.caption(f"Re-ran: {', '.join(report['refreshed']) or 'nothing, every section was still fresh'}")
 
-    render_section("1) Product Overview", results.get("product"))
-    render_section("2) Price Comparison & Availability", results.get("price"))
-    render_section("3) Trending News & Social Buzz", results.get("news"))
+    if not stream_answers:
+        for key, title in SECTION_TITLES.items():
+            render_section(title, results.get(key))
 
-    with st.expander("Raw outputs"):
-        st.json(results)
+    render_raw_outputs(results, tracer, product_query)
 
+# Only touch the runner once a job exists, so importing this module stays side-effect free
+if run_in_background and st.query_params.get("job"):
+    runner = get_job_runner()
+    with st.sidebar:
+        recent = runner.store.list(limit=5)
+        if recent:
+            st.header("Recent jobs")
+            for recent_job in recent:
+                if st.button(f"{recent_job.query} · {recent_job.status}", key=f"job-{recent_job.id}"):
+                    st.query_params["job"] = recent_job.id
 
+    job = runner.store.get(st.query_params["job"])
+    if job is None:
+        st.info("That job is no longer available (the server may have restarted).")
+    if job is not None:
+        snapshot = render_job(job)
+        if snapshot["status"] not in FINISHED:
+            # Poll: the script returns to Streamlit between refreshes, so the page stays responsive
+            time.sleep(1.0)
+            st.rerun()
+        if snapshot["result"]:
+            render_raw_outputs(
+                {key: section["result"] for key, section in snapshot["result"]["sections"].items()},
+                job.options["tracer"],
+                job.query,
+            )
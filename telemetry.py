@@ -0,0 +1,183 @@
+import contextvars
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from mcp_pool import SessionProxy
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    def __init__(self, name, parent, attributes):
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.name = name
+        self.attributes = dict(attributes)
+        # Children inherit the section so tool calls can be grouped per agent
+        if parent and "section" in parent.attributes:
+            self.attributes.setdefault("section", parent.attributes["section"])
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """Records timed spans for agent runs, model attempts, backoff sleeps and tool calls.
+
+    Spans nest through a context variable, so a tool call made while a model
+    attempt is in flight becomes that attempt's child. With a path, every finished
+    span is also appended to it as a JSON line.
+    """
+
+    def __init__(self, path=None, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.status = "error"
+            span.error = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration_ms = round((time.perf_counter() - span._start) * 1000, 2)
+            if self.enabled:
+                self._record(span)
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+    def export_jsonl(self, path):
+        with self._lock, open(path, "a", encoding="utf-8") as f:
+            for span in self.spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+    def export_otel(self, tracer_provider=None):
+        """Replay the recorded spans into OpenTelemetry (requires opentelemetry-api)."""
+        from opentelemetry import trace
+
+        otel_tracer = trace.get_tracer("agentic-shopping", tracer_provider=tracer_provider)
+        exported = {}
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_time)
+        for span in spans:
+            parent = exported.get(span.parent_id)
+            context = trace.set_span_in_context(parent) if parent else None
+            start_ns = int(span.start_time * 1e9)
+            otel_span = otel_tracer.start_span(
+                span.name,
+                context=context,
+                start_time=start_ns,
+                attributes={
+                    key: value if isinstance(value, (str, bool, int, float)) else str(value)
+                    for key, value in span.attributes.items()
+                    if value is not None
+                },
+            )
+            if span.status == "error":
+                otel_span.set_status(trace.Status(trace.StatusCode.ERROR, span.error))
+            otel_span.end(end_time=start_ns + int((span.duration_ms or 0) * 1e6))
+            exported[span.span_id] = otel_span
+
+    def summary(self):
+        """One row per (section, span name) with call counts, latency and token/byte totals."""
+        rows = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            key = (span.attributes.get("section", "-"), span.name)
+            row = rows.setdefault(key, {
+                "section": key[0],
+                "span": key[1],
+                "count": 0,
+                "errors": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "prompt_tokens": 0,
+                "output_tokens": 0,
+                "payload_bytes": 0,
+                "tokens_saved": 0,
+            })
+            row["count"] += 1
+            row["errors"] += span.status == "error"
+            row["total_ms"] = round(row["total_ms"] + (span.duration_ms or 0), 2)
+            row["max_ms"] = max(row["max_ms"], span.duration_ms or 0)
+            row["prompt_tokens"] += span.attributes.get("prompt_tokens") or 0
+            row["output_tokens"] += span.attributes.get("output_tokens") or 0
+            row["payload_bytes"] += span.attributes.get("result_bytes") or 0
+            row["tokens_saved"] += span.attributes.get("tokens_saved") or 0
+        for row in rows.values():
+            row["avg_ms"] = round(row["total_ms"] / row["count"], 2)
+        return list(rows.values())
+
+
+# Used when no tracer is passed: spans are timed but not kept
+NULL_TRACER = Tracer(enabled=False)
+
+
+def usage_attributes(usage):
+    """Token counts from a Gemini response's usage_metadata."""
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+        "total_tokens": getattr(usage, "total_token_count", None),
+    }
+
+
+def tool_result_size(result):
+    """Characters of text content in an MCP CallToolResult."""
+    return sum(len(getattr(item, "text", "") or "") for item in getattr(result, "content", None) or [])
+
+
+class TracingSession(SessionProxy):
+    """Records a span for every MCP tool call with its argument and result sizes."""
+
+    def __init__(self, inner, tracer):
+        super().__init__(inner)
+        self.tracer = tracer
+
+    async def call_tool(self, name, arguments=None, *args, **kwargs):
+        with self.tracer.span(
+            "tool_call",
+            tool=name,
+            args_bytes=len(json.dumps(arguments or {}, ensure_ascii=False, default=str)),
+        ) as span:
+            result = await super().call_tool(name, arguments, *args, **kwargs)
+            span.set(result_bytes=tool_result_size(result), is_error=bool(getattr(result, "isError", False)))
+            return result